@@ -0,0 +1,12 @@
+'''Benchmarks for requestkit.
+
+Every benchmark talks to a local in-process server, so results do not
+depend on the network. Run a benchmark as a module from the directory
+containing the requestkit package, e.g.
+
+    python -m requestkit.benchmarks.bench_dispatch
+
+bench_client and bench_websocket drive Client and WebSocket at a given
+concurrency, payload size and host count, and print a JSON report of
+throughput, p50/p99 latency, CPU time and peak memory.
+'''
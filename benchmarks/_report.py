@@ -0,0 +1,76 @@
+'''Measure a benchmark run and report it as JSON.'''
+
+from __future__ import annotations
+
+import json
+import sys
+from time import perf_counter, process_time
+
+try:
+    import resource
+except ImportError:
+    # resource is not available on Windows.
+    resource = None
+
+
+def percentile(values, q):
+    '''Nearest-rank percentile of values, or None if there is none.'''
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def peak_rss_kib():
+    '''Peak resident memory of this process in KiB, or None if unknown.'''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere.
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class Measurement:
+    '''Wall time and CPU time of the with block.
+
+    The local server runs in the same process, so its CPU time and memory
+    are included.
+    '''
+
+    def __enter__(self):
+        self._wall = perf_counter()
+        self._cpu = process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.elapsed = perf_counter() - self._wall
+        self.cpu = process_time() - self._cpu
+
+    def report(self, benchmark, params, operations, latencies, **extra):
+        '''Return a JSON-serializable report; latencies are in seconds.'''
+        return {
+            'benchmark': benchmark,
+            'params': params,
+            'operations': operations,
+            'elapsed': self.elapsed,
+            'throughput': operations / self.elapsed,
+            'latency': {
+                'p50': percentile(latencies, 50),
+                'p99': percentile(latencies, 99),
+                'max': max(latencies, default=None),
+            },
+            'cpu_seconds': self.cpu,
+            'cpu_percent': 100 * self.cpu / self.elapsed,
+            'peak_rss_kib': peak_rss_kib(),
+            **extra,
+        }
+
+
+def dump(report, path=None):
+    '''Print report as JSON, and also write it to path if set.'''
+    text = json.dumps(report, indent=2)
+    print(text)
+    if path is not None:
+        with open(path, 'w') as file:
+            file.write(text + '\n')
@@ -0,0 +1,61 @@
+'''A local aiohttp server running in a background thread.'''
+
+from __future__ import annotations
+
+import asyncio
+from threading import Event, Thread
+
+from aiohttp import web
+
+
+HOST = '127.0.0.1'
+
+
+async def _echo(request):
+    return web.Response(body=await request.read())
+
+
+class LocalServer:
+    '''Serve an aiohttp application on 127.0.0.1 in a background thread.
+
+    The default application answers every path with the request body.
+    '''
+
+    def __init__(self, app=None, port=0):
+        self.app = app or self._default_app()
+        self.port = port
+        self._ready = Event()
+        self._thread = Thread(target=self._main, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._loop.call_soon_threadsafe(self._closing.set)
+        self._thread.join()
+
+    @property
+    def url(self):
+        return f'http://{HOST}:{self.port}'
+
+    def _default_app(self):
+        app = web.Application()
+        app.add_routes([web.route('*', '/{tail:.*}', _echo)])
+        return app
+
+    def _main(self):
+        asyncio.run(self._async_main())
+
+    async def _async_main(self):
+        self._loop = asyncio.get_running_loop()
+        self._closing = asyncio.Event()
+        runner = web.AppRunner(self.app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, HOST, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        await self._closing.wait()
+        await runner.cleanup()
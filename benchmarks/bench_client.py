@@ -0,0 +1,73 @@
+'''Throughput and latency of Client against a local server, as JSON.'''
+
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import wait
+
+from aiohttp import web
+
+from ..src import Client, Resolver
+from ._report import Measurement, dump
+from ._server import HOST, LocalServer
+
+
+async def _bytes(request):
+    return web.Response(body=b'x' * int(request.match_info['size']))
+
+
+def make_app():
+    app = web.Application()
+    app.add_routes([web.get('/bytes/{size}', _bytes)])
+    return app
+
+
+def run(requests, concurrency, concurrency_per_host, hosts, payload):
+    # Every host name resolves to the local server, so that per-host
+    # scheduling in Throttle is exercised without real DNS.
+    names = [f'host{i}.test' for i in range(hosts)]
+    setting = {
+        'concurrency': concurrency,
+        'concurrency_per_host': concurrency_per_host,
+        'resolver': Resolver(static={name: HOST for name in names}),
+    }
+    with LocalServer(make_app()) as server, Client(setting) as client:
+        urls = [f'http://{name}:{server.port}/bytes/{payload}' for name in names]
+        with Measurement() as measurement:
+            futs = [client.request(urls[i % hosts]) for i in range(requests)]
+            wait(futs)
+        pool = client.pool_stats()
+    resps = [fut.result() for fut in futs]
+    return measurement.report(
+        'client',
+        {
+            'requests': requests,
+            'concurrency': concurrency,
+            'concurrency_per_host': concurrency_per_host,
+            'hosts': hosts,
+            'payload': payload,
+        },
+        requests,
+        [resp.timing.total for resp in resps],
+        failed=sum(resp.status != 200 for resp in resps),
+        connections=pool['created'],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--requests', type=int, default=2000)
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    parser.add_argument('--concurrency-per-host', type=int,
+                        help='default: concurrency divided among hosts')
+    parser.add_argument('--hosts', type=int, default=1)
+    parser.add_argument('--payload', type=int, default=1024, help='response body in bytes')
+    parser.add_argument('-o', '--output', help='also write the report to this file')
+    args = parser.parse_args()
+    concurrency_per_host = args.concurrency_per_host or max(1, args.concurrency // args.hosts)
+    report = run(args.requests, args.concurrency, concurrency_per_host, args.hosts, args.payload)
+    dump(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+'''Sustained requests/sec through Client.request() against a local server.'''
+
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import wait
+from time import perf_counter
+
+from ..src import Client
+from ._server import LocalServer
+
+
+def run(requests, concurrency):
+    setting = {
+        'concurrency': concurrency,
+        'concurrency_per_host': concurrency,
+    }
+    with LocalServer() as server, Client(setting) as client:
+        start = perf_counter()
+        futs = [client.request(f'{server.url}/{i}') for i in range(requests)]
+        wait(futs)
+        elapsed = perf_counter() - start
+    failed = sum(fut.result().status != 200 for fut in futs)
+    return requests / elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--requests', type=int, default=2000)
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    args = parser.parse_args()
+    rate, failed = run(args.requests, args.concurrency)
+    print(f'requests={args.requests} concurrency={args.concurrency} '
+          f'failed={failed} rate={rate:.1f} req/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+'''Parse time and tree equivalence of the HTML parsers behind Response.etree().'''
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from time import perf_counter
+
+from ..src import Request, Response
+from ..src.response import HTML_PARSERS, html5_parser
+
+
+def synthetic_corpus(pages=20):
+    rows = ''.join(f'<tr><td>{i}</td><td><a href="/item/{i}">item {i}</a></td></tr>'
+                   for i in range(500))
+    page = (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>t</title></head>'
+            f'<body><div id="main"><p>text<br>more text</p><table>{rows}</table></div>'
+            f'</body></html>').encode()
+    return [page] * pages
+
+
+def load_corpus(path):
+    return [file.read_bytes() for file in sorted(Path(path).glob('**/*.htm*'))]
+
+
+def make_response(body):
+    req = Request('http://127.0.0.1/')
+    return Response(url=req.url, status=200, reason='OK', headers={},
+                    body=body, request=req, meta=req.meta)
+
+
+def signature(tree, implied=True):
+    '''Tags and texts below <body>, which is what extraction relies on.
+
+    If implied is False, the <tbody> HTML5 inserts into tables is skipped.
+    '''
+    body = tree.find('body')
+    return [(el.tag, (el.text or '').strip(), (el.tail or '').strip())
+            for el in body.iter() if isinstance(el.tag, str)
+            and (implied or el.tag != 'tbody')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('corpus', nargs='?',
+                        help='directory of saved .html pages (default: synthetic pages)')
+    args = parser.parse_args()
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    print(f'pages={len(corpus)} bytes={sum(map(len, corpus))}')
+
+    baseline = [make_response(body).etree(parser='html5lib') for body in corpus]
+    strict = [signature(tree) for tree in baseline]
+    loose = [signature(tree, implied=False) for tree in baseline]
+    for name in HTML_PARSERS:
+        if name == 'html5-parser' and html5_parser is None:
+            print(f'parser={name} not installed')
+            continue
+        start = perf_counter()
+        trees = [make_response(body).etree(parser=name) for body in corpus]
+        elapsed = perf_counter() - start
+        same = sum(signature(tree) == sig for tree, sig in zip(trees, strict))
+        similar = sum(signature(tree, implied=False) == sig for tree, sig in zip(trees, loose))
+        print(f'parser={name} time={elapsed * 1000 / len(corpus):.2f} ms/page '
+              f'equivalent={same}/{len(corpus)} '
+              f'equivalent_without_tbody={similar}/{len(corpus)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+'''Cost of turning a Request into aiohttp request parameters.'''
+
+from __future__ import annotations
+
+import argparse
+from timeit import repeat
+
+from ..src import AsyncClient, Request
+
+
+def run(number, headers):
+    client = AsyncClient({'cookies': {'ck': 'cv'}})
+    req = Request('http://127.0.0.1/get', headers=headers)
+    best = min(repeat(lambda: client._make_aio_req_params(req), number=number, repeat=5))
+    return best / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--number', type=int, default=100000)
+    args = parser.parse_args()
+    for headers in [None, {'hk': 'hv'}]:
+        cost = run(args.number, headers)
+        print(f'headers={headers} cost={cost * 1e6:.2f} us/request')
+
+
+if __name__ == '__main__':
+    main()
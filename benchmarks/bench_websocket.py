@@ -0,0 +1,130 @@
+'''Round-trip throughput and latency of WebSocketClient and WebSocketServer, as JSON.
+
+The client sends messages which the server echoes back, with at most
+window messages in flight.
+'''
+
+from __future__ import annotations
+
+import argparse
+import socket
+import struct
+from threading import BoundedSemaphore, Event
+from time import perf_counter
+
+from ..src import Jsonable, WebSocketClient, WebSocketServer
+from ._report import Measurement, dump
+from ._server import HOST
+
+
+ROUTE = '/bench'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def codec(kind, payload):
+    '''Return encode(sent_at) and decode(msg) -> sent_at for a message kind.'''
+    if kind == 'bytes':
+        padding = b'x' * max(0, payload - 8)
+        return (lambda sent_at: struct.pack('!d', sent_at) + padding,
+                lambda msg: struct.unpack_from('!d', msg)[0])
+    if kind == 'str':
+        # Not valid JSON, so it is delivered to str callbacks.
+        padding = 'x' * payload
+        return (lambda sent_at: f'{sent_at!r} {padding}',
+                lambda msg: float(msg.partition(' ')[0]))
+    padding = 'x' * payload
+    return (lambda sent_at: {'sent_at': sent_at, 'padding': padding},
+            lambda msg: msg['sent_at'])
+
+
+def echo_callbacks():
+    def echo_str(msg: str, server):
+        server.send(msg)
+
+    def echo_bytes(msg: bytes, server):
+        server.send(msg)
+
+    def echo_json(msg: Jsonable, server):
+        server.send(msg)
+
+    return [echo_str, echo_bytes, echo_json]
+
+
+def run(messages, window, kind, payload, compress=False, batch_delay=None):
+    encode, decode = codec(kind, payload)
+    latencies = []
+    done = Event()
+    in_flight = BoundedSemaphore(window)
+
+    def receive(msg):
+        latencies.append(perf_counter() - decode(msg))
+        in_flight.release()
+        if len(latencies) == messages:
+            done.set()
+
+    # Callbacks are chosen by the annotation of msg.
+    def receive_str(msg: str, client):
+        receive(msg)
+
+    def receive_bytes(msg: bytes, client):
+        receive(msg)
+
+    def receive_json(msg: Jsonable, client):
+        receive(msg)
+
+    port = free_port()
+    setting = {
+        'host': HOST,
+        'port': port,
+        'route': ROUTE,
+        'compress': compress,
+        'batch_delay': batch_delay,
+    }
+    with WebSocketServer(callbacks=echo_callbacks(), **setting):
+        with WebSocketClient(callbacks=[receive_str, receive_bytes, receive_json],
+                             **setting) as client:
+            with Measurement() as measurement:
+                for _ in range(messages):
+                    in_flight.acquire()
+                    client.send(encode(perf_counter()))
+                done.wait()
+    return measurement.report(
+        'websocket',
+        {
+            'messages': messages,
+            'window': window,
+            'type': kind,
+            'payload': payload,
+            'compress': compress,
+            'batch_delay': batch_delay,
+        },
+        messages,
+        latencies,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--messages', type=int, default=2000)
+    parser.add_argument('-w', '--window', type=int, default=100,
+                        help='maximum messages in flight')
+    parser.add_argument('-t', '--type', choices=['bytes', 'str', 'json'], default='bytes')
+    parser.add_argument('--payload', type=int, default=1024, help='message size in bytes')
+    parser.add_argument('--compress', action='store_true', help='use permessage-deflate')
+    parser.add_argument('--batch-delay', type=float,
+                        help='group messages into frames within this many seconds')
+    parser.add_argument('-o', '--output', help='also write the report to this file')
+    args = parser.parse_args()
+    report = run(args.messages, args.window, args.type, args.payload,
+                 args.compress, args.batch_delay)
+    dump(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,12 @@ wrapper over AIOHTTP. Currently requestkit supports HTTP
 client, WebSocket client/server.
 '''
 
+from .cache import *
 from .client import *
 from .request import *
+from .resolver import *
 from .response import *
+from .retry import *
+from .runtime import *
+from .stats import *
 from .websocket import *
@@ -0,0 +1,246 @@
+'''HTTP cache used in Client.'''
+
+from __future__ import annotations
+
+__all__ = ['Cache']
+
+import hashlib
+import pickle
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from time import time
+from typing import Optional, Tuple, Union
+
+import aiofiles
+import aiofiles.os
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from .response import Response
+
+
+# Statuses which may be stored, as long as the response allows it.
+CACHEABLE_STATUSES = frozenset({200, 203, 300, 301, 404, 410})
+
+# Requests setting these headers themselves bypass the cache.
+PRIVATE_HEADERS = ('Authorization', 'Cookie')
+
+
+def _parse_cache_control(value):
+    directives = {}
+    for item in value.split(','):
+        name, _, arg = item.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+def _parse_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+@dataclass
+class _Entry:
+    '''A stored response and what is needed to decide whether to reuse it.'''
+
+    response: Response     # request and meta are None.
+    vary: Tuple[Tuple[str, Optional[str]], ...]
+    fresh_until: float
+    size: int
+
+    def fresh(self, now):
+        return now < self.fresh_until
+
+    def validators(self):
+        headers = {}
+        etag = self.response.headers.get('ETag')
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        last_modified = self.response.headers.get('Last-Modified')
+        if last_modified is not None:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+
+class Cache:
+    '''HTTP cache used in Client.
+
+    Responses to GET requests are kept in an in-memory LRU bounded by
+    max_bytes, and also written to directory if it is set. Freshness follows
+    Cache-Control and Expires. Stale responses with an ETag or Last-Modified
+    are revalidated, and a 304 is turned back into a full Response.
+    '''
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024,
+                 directory: Optional[Union[str, Path]] = None) -> None:
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory is not None else None
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._revalidations = 0
+
+    def stats(self) -> dict:
+        '''Counters of this cache.'''
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'revalidations': self._revalidations,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+        }
+
+    def clear(self) -> None:
+        '''Drop all in-memory entries. Files in directory are kept.'''
+        self._entries.clear()
+        self._bytes = 0
+
+    def _key(self, req):
+        url = req.url.update_query(req.params) if req.params else req.url
+        return f'{req.method} {url}'
+
+    def _cacheable(self, req, default_headers):
+        if req.method != 'GET' or req.save_to is not None:
+            return False
+        # Credentials of a single request are not part of the key,
+        # so its response must not be served to other requests.
+        if req.cookies:
+            return False
+        if req.headers and any(name in CIMultiDict(req.headers) for name in PRIVATE_HEADERS):
+            return False
+        cache_control = self._header(req, default_headers, 'Cache-Control') or ''
+        return 'no-store' not in _parse_cache_control(cache_control)
+
+    def _header(self, req, default_headers, name):
+        if req.headers:
+            value = CIMultiDict(req.headers).get(name)
+            if value is not None:
+                return value
+        return default_headers.get(name)
+
+    async def _lookup(self, req, default_headers):
+        '''Return a stored entry matching req, fresh or not, or None.'''
+        key = self._key(req)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        elif self.directory is not None:
+            entry = await self._load(key)
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is None:
+            return None
+        # Only one variant is kept for each url.
+        for name, value in entry.vary:
+            if self._header(req, default_headers, name) != value:
+                return None
+        cache_control = self._header(req, default_headers, 'Cache-Control') or ''
+        if 'no-cache' in _parse_cache_control(cache_control):
+            entry = replace(entry, fresh_until=0)
+        return entry
+
+    def _use(self, entry, req, html_parser):
+        '''Turn a fresh entry into the Response to req.'''
+        self._hits += 1
+        return self._response(entry.response, req, html_parser)
+
+    async def _update(self, req, entry, resp, default_headers):
+        '''Store a fetched Response, or turn a 304 to a request
+        conditional on entry into a full Response.
+        '''
+        if entry is None or resp.status != 304:
+            self._misses += 1
+            await self._store(req, resp, default_headers)
+            return resp
+        self._revalidations += 1
+        headers = CIMultiDict(entry.response.headers)
+        for name in set(resp.headers.keys()):
+            if name.lower() not in ('content-length', 'content-encoding', 'transfer-encoding'):
+                headers.popall(name, None)
+                headers.extend((name, value) for value in resp.headers.getall(name))
+        stored = replace(entry.response, headers=CIMultiDictProxy(headers))
+        await self._store(req, stored, default_headers)
+        return replace(self._response(stored, req, resp.html_parser), timing=resp.timing)
+
+    async def _store(self, req, resp, default_headers):
+        if resp.status not in CACHEABLE_STATUSES:
+            return
+        headers = resp.headers
+        cache_control = _parse_cache_control(headers.get('Cache-Control', ''))
+        vary = [name.strip() for name in headers.get('Vary', '').split(',') if name.strip()]
+        if 'no-store' in cache_control or '*' in vary:
+            return
+        now = time()
+        fresh_until = now
+        if 'no-cache' in cache_control:
+            pass
+        elif cache_control.get('max-age', '').isdigit():
+            age = headers.get('Age', '0')
+            age = int(age) if age.isdigit() else 0
+            fresh_until = now + int(cache_control['max-age']) - age
+        elif 'Expires' in headers:
+            expires = _parse_date(headers['Expires']) or 0
+            date = _parse_date(headers.get('Date', '')) or now
+            fresh_until = now + expires - date
+        if fresh_until <= now and 'ETag' not in headers and 'Last-Modified' not in headers:
+            # Neither reusable nor revalidatable.
+            return
+        response = replace(resp, headers=CIMultiDictProxy(CIMultiDict(headers)),
+                           request=None, meta=None, parsed=None, timing=None)
+        size = len(resp.body) + sum(len(k) + len(v) for k, v in headers.items())
+        entry = _Entry(
+            response=response,
+            vary=tuple((name, self._header(req, default_headers, name)) for name in vary),
+            fresh_until=fresh_until,
+            size=size,
+        )
+        key = self._key(req)
+        self._remember(key, entry)
+        if self.directory is not None:
+            await self._dump(key, entry)
+
+    def _response(self, stored, req, html_parser):
+        return replace(stored, request=req, meta=req.meta, html_parser=html_parser)
+
+    def _remember(self, key, entry):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self._bytes -= old.size
+
+    def _path(self, key):
+        return self.directory / f'{hashlib.sha256(key.encode()).hexdigest()}.pickle'
+
+    async def _load(self, key):
+        path = self._path(key)
+        try:
+            async with aiofiles.open(path, 'rb') as file:
+                data = await file.read()
+            entry = pickle.loads(data)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # A broken or outdated file is simply a miss.
+            await aiofiles.os.remove(path)
+            return None
+        headers = CIMultiDictProxy(entry.response.headers)
+        return replace(entry, response=replace(entry.response, headers=headers))
+
+    async def _dump(self, key, entry):
+        state = replace(entry, response=replace(
+            entry.response, headers=CIMultiDict(entry.response.headers)))
+        async with aiofiles.open(self._path(key), 'wb') as file:
+            await file.write(pickle.dumps(state))
@@ -2,57 +2,71 @@
 
 from __future__ import annotations
 
-__all__ = ['Client']
+__all__ = ['AsyncClient', 'Client']
 
 import asyncio
 import logging
-from concurrent.futures import Future
-from contextlib import asynccontextmanager
+import socket
+from collections import deque
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
 from copy import deepcopy
+from dataclasses import replace
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from functools import partial
-from queue import Empty, Queue
-from threading import Thread
-from time import sleep
-from typing import Optional
-from weakref import WeakValueDictionary
+from itertools import islice
+from queue import Empty, SimpleQueue
+from threading import Event, Thread
+from time import monotonic, time
+from typing import Iterable, Iterator, Optional, Union
 
 import aiofiles
-from aiohttp import ClientSession, ClientTimeout
+import aiofiles.os
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, TraceConfig
 from multidict import CIMultiDict
 from yarl import URL
 
 from .request import Request
-from .response import Response
+from .response import Response, _run_parse
+from .retry import RetryPolicy
+from .stats import Timing, _Stats
+from .throttle import Throttle
 
 
-class Throttle:
-    '''Throttle used to contorl the maximum number of concurrent requests'''
+# Seconds over which pool_stats() averages new connections.
+POOL_RATE_WINDOW = 10
 
-    def __init__(self, concur, concur_per_host):
-        # concur is the maximum number of total concurrent requests.
-        # concur_per_host is the maximum number of concurrent requests towards one host.
-        self._concur_sema = asyncio.Semaphore(concur)
-        self._host_sema_factory = partial(asyncio.Semaphore, concur_per_host)
-        self._hosts = WeakValueDictionary()
 
-    @asynccontextmanager
-    async def request(self, host):
-        '''This method yield when both concurrent limits are satisfied.'''
-        sema = self._host_sema_factory()
-        host_sema = self._hosts.setdefault(host, sema)
-        async with self._concur_sema, host_sema:
-            yield
+class BodyTooLargeError(ValueError):
+    '''Raised when a response body exceeds max_body_size.'''
 
 
-class Client:
-    '''HTTP Client'''
+class AsyncClient:
+    '''Asynchronous HTTP Client running on the caller's event loop'''
 
     # Default setting
     setting: dict = {
         'timeout': 20,
         'retry': 1,
+        'retry_policy': RetryPolicy(),
         'concurrency': 4,
         'concurrency_per_host': 2,
+        'max_body_size': None,
+        'hosts': {},
+        'rate': None,
+        'rate_per_host': None,
+        'html_parser': 'html5lib',
+        'parse_workers': None,
+        'cache': None,
+        'coalesce': False,
+        'pool_size': None,
+        'pool_size_per_host': None,
+        'keepalive_timeout': 15,
+        'dns_cache_ttl': 10,
+        'resolver': None,
+        'happy_eyeballs_delay': 0.25,
+        'runtime': None,
+        'share_connector': False,
 
         'headers': CIMultiDict({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
@@ -69,86 +83,322 @@ class Client:
     def __init__(self, setting: Optional[dict] = None) -> None:
         self._name = self.__class__.__name__
         self._logger = logging.getLogger(self._name)
-        self._queue = Queue()
-        self._running = True
         self.setting = deepcopy(self.setting)
         if setting:
+            setting = dict(setting)
             headers = setting.pop('headers', {})
             self.setting['headers'].update(headers)
             cookies = setting.pop('cookies', {})
             self.setting['cookies'].update(cookies)
             self.setting.update(setting)
-        self._thread = Thread(target=self._main)
-        self._thread.start()
+        self._session = None
+        self._throttle = None
+        self._parse_executor = None
+        self._in_flight = {}
+        self._created = deque()
+        self._created_total = 0
+        self._reused = 0
+        self._stats = _Stats()
 
-    def __enter__(self):
+    async def __aenter__(self):
+        await self.start()
         return self
 
-    def __exit__(self, exc_type, exc_value, traceback):
-        self.close()
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
 
-    def request(self, url, **kwargs) -> Future:
-        '''Schedule a request's execution.'''
-        req = Request(url, **kwargs)
-        fut = Future()
-        self._queue.put((fut, req))
-        return fut
+    async def start(self) -> None:
+        '''Start the client. This must be called in a running event loop.'''
+        self._logger.info('start')
+        timeout = ClientTimeout(total=self.setting['timeout'])
+        self._throttle = Throttle(self.setting['concurrency'],
+                                  self.setting['concurrency_per_host'],
+                                  self.setting['hosts'],
+                                  self.setting['rate'],
+                                  self.setting['rate_per_host'])
+        options = self._connector_options()
+        if self._shares_connector():
+            connector = self.setting['runtime']._acquire_connector(options)
+        else:
+            connector = TCPConnector(**options)
+        self._session = ClientSession(connector=connector,
+                                      connector_owner=not self._shares_connector(),
+                                      timeout=timeout,
+                                      headers=self.setting['headers'],
+                                      cookies=self.setting['cookies'],
+                                      trace_configs=[self._make_trace_config()])
+        resolver = self.setting['resolver']
+        if resolver is not None:
+            for exc in await resolver._prefetch(socket.AF_UNSPEC):
+                self._logger.warning(f'prefetch failed: {exc!r}')
 
-    def close(self) -> None:
-        '''Close the client.'''
-        self._running = False
-        while self._thread.is_alive():
-            sleep(0.1)
+    async def request(self, url, **kwargs) -> Response:
+        '''Execute a request.'''
+        return await self._process(Request(url, **kwargs))
 
-    def _main(self):
-        asyncio.run(self._async_main())
+    def pool_stats(self) -> dict:
+        '''Statistics of the connection pool.'''
+        connector = self._session.connector
+        # aiohttp has no public API for the current pool size.
+        idle = sum(len(conns) for conns in connector._conns.values())
+        active = len(connector._acquired)
+        now = monotonic()
+        while self._created and self._created[0] < now - POOL_RATE_WINDOW:
+            self._created.popleft()
+        return {
+            'open': active + idle,
+            'active': active,
+            'idle': idle,
+            'created': self._created_total,
+            'reused': self._reused,
+            'created_per_second': len(self._created) / POOL_RATE_WINDOW,
+        }
 
-    async def _async_main(self):
-        self._logger.info('start')
-        timeout = ClientTimeout(total=self.setting['timeout'])
-        throttle = Throttle(self.setting['concurrency'],
-                            self.setting['concurrency_per_host'])
-        async with ClientSession(timeout=timeout,
-                                 headers=self.setting['headers'],
-                                 cookies=self.setting['cookies']) as session:
-            while self._running:
-                try:
-                    fut, req = self._queue.get(timeout=0.05)
-                except Empty:
-                    continue
-                else:
-                    if fut.set_running_or_notify_cancel():
-                        task = asyncio.create_task(self._process(req, session, throttle))
-                        task.add_done_callback(lambda task: fut.set_result(task.result()))
-                    self._queue.task_done()
-                finally:
-                    await asyncio.sleep(0.1)
-        # https://docs.aiohttp.org/en/stable/client_advanced.html#graceful-shutdown
-        await asyncio.sleep(1)
+    def stats(self) -> dict:
+        '''Counters and latency histograms per host, and pool_stats().'''
+        return {
+            'hosts': self._stats.snapshot(),
+            'pool': self.pool_stats(),
+        }
+
+    async def close(self) -> None:
+        '''Close the client.'''
+        # The session forgets its connector once closed.
+        connector = self._session.connector
+        await self._session.close()
+        if self._shares_connector():
+            await self.setting['runtime']._release_connector(connector, self._connector_options())
+        if self._parse_executor is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._parse_executor.shutdown)
+        # ClientSession.close() waits for the connections to be closed.
         self._logger.info('close')
 
-    async def _process(self, req, session, throttle):
+    def _shares_connector(self):
+        return self.setting['runtime'] is not None and self.setting['share_connector']
+
+    def _connector_options(self):
+        # By default the pool is as large as the Throttle lets it be used.
+        pool_size = self.setting['pool_size']
+        if pool_size is None:
+            pool_size = self.setting['concurrency']
+        pool_size_per_host = self.setting['pool_size_per_host']
+        if pool_size_per_host is None:
+            pool_size_per_host = max([self.setting['concurrency_per_host']] + [
+                host['concurrency'] for host in self.setting['hosts'].values()
+                if 'concurrency' in host
+            ])
+        options = {'keepalive_timeout': self.setting['keepalive_timeout']}
+        if options['keepalive_timeout'] == 0:
+            options = {'force_close': True}
+        if self.setting['resolver'] is not None:
+            # The Resolver has its own cache.
+            options.update(resolver=self.setting['resolver'], use_dns_cache=False)
+        else:
+            options.update(ttl_dns_cache=self.setting['dns_cache_ttl'])
+        return dict(limit=pool_size,
+                    limit_per_host=pool_size_per_host,
+                    family=socket.AF_UNSPEC,
+                    happy_eyeballs_delay=self.setting['happy_eyeballs_delay'],
+                    **options)
+
+    def _make_trace_config(self):
+        # The Timing of each request is passed as trace_request_ctx.
+        trace_config = TraceConfig()
+        trace_config.on_connection_queued_start.append(self._on_connection_queued_start)
+        trace_config.on_connection_queued_end.append(self._on_connection_queued_end)
+        trace_config.on_connection_create_start.append(self._on_connection_create_start)
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        trace_config.on_dns_resolvehost_start.append(self._on_dns_resolvehost_start)
+        trace_config.on_dns_resolvehost_end.append(self._on_dns_resolvehost_end)
+        trace_config.on_request_headers_sent.append(self._on_request_headers_sent)
+        trace_config.on_request_end.append(self._on_request_end)
+        return trace_config
+
+    async def _on_connection_queued_start(self, session, context, params):
+        context.queued = monotonic()
+
+    async def _on_connection_queued_end(self, session, context, params):
+        context.trace_request_ctx.queue += monotonic() - context.queued
+
+    async def _on_connection_create_start(self, session, context, params):
+        context.connecting = monotonic()
+        context.dns = context.trace_request_ctx.dns
+
+    async def _on_connection_create_end(self, session, context, params):
+        now = monotonic()
+        self._created.append(now)
+        self._created_total += 1
+        timing = context.trace_request_ctx
+        # DNS is resolved while the connection is being created.
+        timing.connect += now - context.connecting - (timing.dns - context.dns)
+
+    async def _on_connection_reuseconn(self, session, context, params):
+        self._reused += 1
+
+    async def _on_dns_resolvehost_start(self, session, context, params):
+        context.resolving = monotonic()
+
+    async def _on_dns_resolvehost_end(self, session, context, params):
+        context.trace_request_ctx.dns += monotonic() - context.resolving
+
+    async def _on_request_headers_sent(self, session, context, params):
+        # Headers are sent again for every redirect.
+        if not hasattr(context, 'sent'):
+            context.sent = monotonic()
+
+    async def _on_request_end(self, session, context, params):
+        context.trace_request_ctx.ttfb += monotonic() - context.sent
+
+    async def _process(self, req):
         self._logger.debug(f'{req} pending')
-        async with throttle.request(req.url.host):
+        start = monotonic()
+        key = self._coalesce_key(req) if self.setting['coalesce'] else None
+        if key is None:
+            resp = await self._retrieve(req)
+        else:
+            resp = await self._retrieve_shared(req, key)
+        if req.parse is not None and resp.status != -1:
+            await self._parse(resp)
+        if resp.timing is None:
+            # Served by the cache without touching the network.
+            resp.timing = Timing()
+        resp.timing.total = monotonic() - start
+        self._stats.record(req.url.host, resp)
+        self._logger.debug(f'{req} => {resp}')
+        return resp
+
+    async def _retrieve(self, req):
+        cache = self.setting['cache']
+        if cache is not None and cache._cacheable(req, self.setting['headers']):
+            return await self._fetch_cached(req, cache)
+        return await self._fetch(req)
+
+    async def _retrieve_shared(self, req, key):
+        '''Share one in-flight retrieval among identical requests.'''
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._retrieve(req))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda task: self._in_flight.pop(key, None))
+        else:
+            self._logger.debug(f'{req} joins an in-flight request')
+        # A cancelled caller must not cancel the retrieval for the others.
+        resp = await asyncio.shield(task)
+        timing = replace(resp.timing) if resp.timing is not None else None
+        return replace(resp, request=req, meta=req.meta, timing=timing)
+
+    def _coalesce_key(self, req):
+        '''Return what identifies req among in-flight requests,
+        or None if req must not be shared.
+        '''
+        if (req.method not in ('GET', 'HEAD') or req.file is not None
+                or req.save_to is not None):
+            return None
+        url = req.url.update_query(req.params) if req.params else req.url
+        headers = tuple(sorted((k.lower(), v) for k, v in (req.headers or {}).items()))
+        cookies = tuple(sorted((req.cookies or {}).items()))
+        key = (req.method, str(url), headers, cookies, req.max_body_size)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    async def _fetch_cached(self, req, cache):
+        entry = await cache._lookup(req, self.setting['headers'])
+        if entry is not None and entry.fresh(time()):
+            self._logger.debug(f'{req} cache hit')
+            return cache._use(entry, req, self.setting['html_parser'])
+        validators = entry.validators() if entry is not None else None
+        resp = await self._fetch(req, validators)
+        return await cache._update(req, entry, resp, self.setting['headers'])
+
+    async def _fetch(self, req, extra_headers=None):
+        timeout, retry, policy, req_params = self._make_aio_req_params(req)
+        if extra_headers:
+            req_params['headers'] = dict(req_params['headers'] or {}, **extra_headers)
+        timing = Timing()
+        req_params['trace_request_ctx'] = timing
+        policy._deposit()
+        for attempt in range(retry+1):
+            result = await self._attempt(req, req_params, timing)
+            if (attempt == retry or not policy.retryable(result)
+                    or not policy._withdraw()):
+                break
+            retry_after = None if isinstance(result, Exception) else self._retry_after(result)
+            delay = policy.backoff(attempt, retry_after)
+            self._logger.debug(f'{req} retry in {delay:.2f}s')
+            # Wait outside the throttle so that the slot can be reused.
+            await asyncio.sleep(delay)
+            timing.backoff += delay
+        if isinstance(result, Exception):
+            if isinstance(result, asyncio.TimeoutError):
+                result = asyncio.TimeoutError(f'{timeout}s')
+            elif not isinstance(result, (BodyTooLargeError,) + policy.exceptions):
+                self._logger.error('unexpected exception', exc_info=result)
+            result = await self._make_response(req, result)
+        result.timing = timing
+        return result
+
+    async def _parse(self, resp):
+        '''Set resp.parsed by running request.parse in a worker process.'''
+        if self._parse_executor is None:
+            self._parse_executor = ProcessPoolExecutor(self.setting['parse_workers'])
+        # Only ship what parsing needs, in picklable form.
+        shipped = replace(resp, headers=CIMultiDict(resp.headers), request=None, meta=None)
+        loop = asyncio.get_running_loop()
+        try:
+            resp.parsed = await loop.run_in_executor(
+                self._parse_executor, _run_parse, shipped, resp.request.parse)
+        except Exception as exc:
+            self._logger.warning(f'{resp.request} parse failed: {exc!r}')
+            resp.parsed = exc
+
+    async def _attempt(self, req, req_params, timing):
+        '''Make one attempt and return either a Response or an exception.'''
+        timing.attempts += 1
+        start = monotonic()
+        async with self._throttle.request(req.url.host) as delay:
+            timing.throttle += delay
+            timing.queue += monotonic() - start - delay
             self._logger.debug(f'{req} processing')
-            timeout, retry, req_params = self._make_aio_req_params(req)
+            if req.file is not None:
+                # A fresh generator for every attempt, since one is exhausted.
+                req_params = dict(req_params, data=self._file_gen(req.file))
             try:
-                for _ in range(retry+1):
-                    try:
-                        async with session.request(**req_params) as aio_resp:
-                            resp = await self._make_response(req, aio_resp)
-                            break
-                    except asyncio.TimeoutError:
-                        continue
-                else:
-                    raise asyncio.TimeoutError(f'{timeout}s')
+                async with self._session.request(**req_params) as aio_resp:
+                    received = monotonic()
+                    resp = await self._make_response(req, aio_resp)
+                    timing.transfer += monotonic() - received
+            except asyncio.CancelledError:
+                raise
             except Exception as exc:
-                if not isinstance(exc, (asyncio.TimeoutError, asyncio.CancelledError)):
-                    self._logger.exception('unexpected exception')
-                resp = await self._make_response(req, exc)
-            finally:
-                self._logger.debug(f'{req} => {resp}')
-                return resp
+                return exc
+            delay = self._retry_after(resp)
+            if delay is not None:
+                self._throttle.pause(req.url.host, delay)
+            return resp
+
+    def _retry_after(self, resp):
+        '''Return how long the server asks us to back off, or None.'''
+        if resp.status not in (429, 503):
+            return None
+        value = resp.headers.get('Retry-After')
+        if value is None:
+            return 1 if resp.status == 429 else None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+        return max((date - datetime.now(timezone.utc)).total_seconds(), 0)
 
     async def _file_gen(self, path):
         async with aiofiles.open(path, 'rb') as file:
@@ -157,23 +407,57 @@ class Client:
                 yield chunk
                 chunk = await file.read(64*1024)
 
+    async def _body_gen(self, req, aio_resp):
+        max_body_size = self._max_body_size(req)
+        if max_body_size is None:
+            async for chunk in aio_resp.content.iter_chunked(64*1024):
+                yield chunk
+            return
+        # Reject early if the server announces an oversized body.
+        if (aio_resp.content_length or 0) > max_body_size:
+            raise BodyTooLargeError(f'{max_body_size} bytes')
+        size = 0
+        async for chunk in aio_resp.content.iter_chunked(64*1024):
+            size += len(chunk)
+            if size > max_body_size:
+                raise BodyTooLargeError(f'{max_body_size} bytes')
+            yield chunk
+
+    async def _save_body(self, req, aio_resp):
+        file = None
+        try:
+            async with aiofiles.open(req.save_to, 'wb') as file:
+                async for chunk in self._body_gen(req, aio_resp):
+                    await file.write(chunk)
+        except BaseException:
+            # Do not leave a truncated download behind.
+            if file is not None:
+                await aiofiles.os.remove(req.save_to)
+            raise
+
+    def _max_body_size(self, req):
+        if req.max_body_size is not None:
+            return req.max_body_size
+        return self.setting['max_body_size']
+
     def _make_aio_req_params(self, req):
         url = req.url
         method = req.method
         params = req.params
         timeout = req.timeout or self.setting['timeout']
-        retry = req.retry or self.setting['retry']
+        retry = req.retry if req.retry is not None else self.setting['retry']
+        policy = req.retry_policy or self.setting['retry_policy']
 
-        headers = deepcopy(self.setting['headers'])
-        headers.update(req.headers or {})
-        cookies = deepcopy(self.setting['cookies'])
-        cookies.update(req.cookies or {})
+        # Client headers and cookies are set once on the ClientSession,
+        # which merges them with the per-request ones.
+        headers = req.headers
+        cookies = req.cookies
 
         body = req.body
         json = req.json
         text = req.text
         form = req.form
-        file = req.file and self._file_gen(req.file)
+        file = req.file
 
         possible_body = [body, json, text, form, file]
         num = len([v for v in possible_body if v is not None])
@@ -182,7 +466,7 @@ class Client:
         elif method == 'POST':
             assert num <= 1, 'POST require exactly one request body.'
 
-        return (timeout, retry, {
+        return (timeout, retry, policy, {
             'url': url,
             'method': method,
             'timeout': timeout,
@@ -190,7 +474,7 @@ class Client:
             'headers': headers,
             'cookies': cookies,
             'json': json,
-            'data': form or body or text or file,
+            'data': form or body or text,
         })
 
     async def _make_response(self, req, result):
@@ -203,15 +487,224 @@ class Client:
                 body=b'',
                 request=req,
                 meta=req.meta,
+                html_parser=self.setting['html_parser'],
+            )
+        elif req.save_to is not None:
+            await self._save_body(req, result)
+            resp = Response(
+                url=result.url,
+                status=result.status,
+                reason=result.reason,
+                headers=result.headers,
+                body=b'',
+                request=req,
+                meta=req.meta,
+                path=req.save_to,
+                html_parser=self.setting['html_parser'],
             )
         else:
+            if self._max_body_size(req) is not None:
+                body = b''.join([chunk async for chunk in self._body_gen(req, result)])
+            else:
+                body = await result.read()
             resp = Response(
                 url=result.url,
                 status=result.status,
                 reason=result.reason,
                 headers=result.headers,
-                body=await result.read(),
+                body=body,
                 request=req,
                 meta=req.meta,
+                html_parser=self.setting['html_parser'],
             )
         return resp
+
+
+class Client:
+    '''HTTP Client
+
+    Client runs an AsyncClient in a background thread and exposes
+    a synchronous interface over it.
+    '''
+
+    # Default setting
+    setting: dict = AsyncClient.setting
+
+    def __init__(self, setting: Optional[dict] = None) -> None:
+        self._name = self.__class__.__name__
+        self._logger = logging.getLogger(self._name)
+        self._async_client = AsyncClient(setting)
+        self._async_client._logger = self._logger
+        self.setting = self._async_client.setting
+        self._loop = None
+        # Set once the client has started, and also when it fails to,
+        # with _error.
+        self._ready = Event()
+        self._error = None
+        runtime = self.setting['runtime']
+        if runtime is not None:
+            self._thread = runtime._host(self._run(), self._stop)
+        else:
+            self._thread = Thread(target=self._main)
+            self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            self._thread.join()
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def request(self, url, **kwargs) -> Future:
+        '''Schedule a request's execution.'''
+        req = Request(url, **kwargs)
+        fut = Future()
+        self._loop.call_soon_threadsafe(self._submit, fut, req)
+        return fut
+
+    def request_many(self, requests: Iterable[Union[str, URL, dict]], *,
+                     lookahead: Optional[int] = None) -> Iterator[Response]:
+        '''Schedule many requests and yield Responses in completion order.
+
+        Each item is either a url or a dict of keyword arguments for request().
+        If lookahead is set, at most lookahead requests are pending at a time
+        and requests is consumed lazily.
+        '''
+        assert lookahead is None or lookahead > 0, 'lookahead must be positive.'
+        reqs = map(self._make_request, requests)
+        results = SimpleQueue()
+        pending = 0
+        done = []
+        while True:
+            room = lookahead - pending if lookahead else None
+            batch = list(islice(reqs, room)) if room != 0 else []
+            if batch:
+                self._loop.call_soon_threadsafe(self._submit_many, batch, results.put)
+                pending += len(batch)
+            yield from map(self._result, done)
+            if not pending:
+                return
+            # Collect everything finished so far, so that the next
+            # refill crosses the thread boundary only once.
+            done = [results.get()]
+            try:
+                while True:
+                    done.append(results.get_nowait())
+            except Empty:
+                pass
+            pending -= len(done)
+
+    def pool_stats(self) -> dict:
+        '''Statistics of the connection pool.'''
+        return self._call(self._async_client.pool_stats)
+
+    def stats(self) -> dict:
+        '''Counters and latency histograms per host, and pool_stats().'''
+        return self._call(self._async_client.stats)
+
+    def close(self, drain: bool = True, timeout: Optional[float] = None) -> None:
+        '''Close the client.
+
+        If drain is True, wait at most timeout seconds for pending requests
+        to finish first. Requests still pending are cancelled, and their
+        futures raise concurrent.futures.CancelledError. Closing a closed
+        client does nothing.
+        '''
+        self._stop(drain, timeout)
+        self._thread.join()
+
+    def _stop(self, drain=False, timeout=None):
+        '''Make the event loop thread shut down. Called from any thread.'''
+        if self._thread.is_alive():
+            try:
+                self._loop.call_soon_threadsafe(self._shutdown, drain, timeout)
+            except RuntimeError:
+                # The event loop has just been closed by another close().
+                pass
+
+    def _main(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        try:
+            await self._async_main()
+        except Exception as exc:
+            self._error = exc
+            self._logger.error('unexpected exception', exc_info=exc)
+        finally:
+            # Never leave the constructor blocked if the client fails to start.
+            self._ready.set()
+
+    async def _async_main(self):
+        self._loop = asyncio.get_running_loop()
+        self._closing = asyncio.Event()
+        self._drain = (True, None)
+        self._tasks = set()
+        async with self._async_client:
+            self._ready.set()
+            await self._closing.wait()
+            drain, timeout = self._drain
+            pending = set(self._tasks)
+            if pending and drain:
+                _, pending = await asyncio.wait(pending, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _shutdown(self, drain, timeout):
+        self._drain = (drain, timeout)
+        self._closing.set()
+
+    def _call(self, func, *args):
+        '''Run func on the event loop thread and return its result.'''
+        fut = Future()
+
+        def run():
+            try:
+                fut.set_result(func(*args))
+            except Exception as exc:
+                fut.set_exception(exc)
+
+        self._loop.call_soon_threadsafe(run)
+        return fut.result()
+
+    def _make_request(self, item):
+        if isinstance(item, dict):
+            return Request(**item)
+        return Request(item)
+
+    def _submit(self, fut, req):
+        '''Called on the event loop thread for every Client.request().'''
+        if fut.set_running_or_notify_cancel():
+            task = self._spawn(req)
+            task.add_done_callback(partial(self._resolve, fut))
+
+    def _submit_many(self, reqs, callback):
+        '''Called on the event loop thread for every batch of Client.request_many().'''
+        for req in reqs:
+            task = self._spawn(req)
+            task.add_done_callback(callback)
+
+    @staticmethod
+    def _resolve(fut, task):
+        '''Copy the outcome of a task to a concurrent Future.'''
+        try:
+            fut.set_result(Client._result(task))
+        except Exception as exc:
+            fut.set_exception(exc)
+
+    @staticmethod
+    def _result(task):
+        if task.cancelled():
+            raise CancelledError()
+        return task.result()
+
+    def _spawn(self, req):
+        task = asyncio.create_task(self._async_client._process(req))
+        # Keep a strong reference so pending tasks are not garbage collected.
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
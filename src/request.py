@@ -6,10 +6,12 @@ __all__ = ['Request']
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, NewType, Optional, SupportsFloat, Union
+from typing import Any, Callable, NewType, Optional, SupportsFloat, Union
 
 from yarl import URL
 
+from .retry import RetryPolicy
+
 
 # A library-defined type used in type annotations.
 Jsonable = NewType('Jsonable', Any)
@@ -37,12 +39,18 @@ class Request:
 
     timeout: Optional[SupportsFloat] = None
     retry: Optional[int] = None
+    retry_policy: Optional[RetryPolicy] = None
     meta: Optional[dict] = None
 
+    save_to: Optional[Union[str, Path]] = None
+    max_body_size: Optional[int] = None
+    parse: Optional[Union[str, tuple, Callable]] = None
+
     def __post_init__(self):
         self.url = URL(self.url)
         self.method = self.method.upper()
         self.file = Path(self.file) if self.file is not None else self.file
+        self.save_to = Path(self.save_to) if self.save_to is not None else self.save_to
 
     def __repr__(self):
         return f'<Request {self.method} {self.url}>'
@@ -0,0 +1,144 @@
+'''The Resolver class used in Client.'''
+
+from __future__ import annotations
+
+__all__ = ['Resolver']
+
+import asyncio
+import ipaddress
+import socket
+from itertools import chain, zip_longest
+from time import monotonic
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from aiohttp.abc import AbstractResolver, ResolveResult
+from aiohttp.resolver import ThreadedResolver
+
+
+_NUMERIC_FLAGS = socket.AI_NUMERICHOST | socket.AI_NUMERICSERV
+
+
+class Resolver(AbstractResolver):
+    '''DNS resolver with a TTL-aware cache, used in Client.
+
+    A Resolver may be shared by many Clients, which then share its cache.
+    Hosts in static never hit DNS, and hosts in prefetch are resolved when
+    a Client starts. Subclass Resolver and override lookup() to use another
+    DNS backend, e.g. one reporting the TTL of each record.
+    '''
+
+    def __init__(self, ttl: float = 60,
+                 static: Optional[Dict[str, Union[str, Iterable[str]]]] = None,
+                 prefetch: Iterable[str] = ()) -> None:
+        self.ttl = ttl
+        self.static = {
+            host: [ips] if isinstance(ips, str) else list(ips)
+            for host, ips in (static or {}).items()
+        }
+        self.prefetch = list(prefetch)
+        # Addresses do not depend on the port, so entries are cached with
+        # port 0 and the port is filled in on every resolve().
+        self._cache = {}
+        self._last_sweep = 0
+        self._pending = {}
+        self._hits = 0
+        self._misses = 0
+
+    async def resolve(self, host: str, port: int = 0,
+                      family: socket.AddressFamily = socket.AF_INET) -> List[ResolveResult]:
+        '''Return addresses of host, ordered for happy eyeballs.'''
+        if host in self.static:
+            addrs = self._static(host, family)
+        else:
+            addrs = await self._resolve(host, family)
+        return [dict(addr, port=port) for addr in addrs]
+
+    async def lookup(self, host: str, family: socket.AddressFamily
+                     ) -> Tuple[List[ResolveResult], Optional[float]]:
+        '''Look host up in DNS.
+
+        Return its addresses and the seconds they may be cached for,
+        or None for the default ttl.
+        '''
+        return await ThreadedResolver().resolve(host, 0, family), None
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        '''Counters of this resolver.'''
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'entries': len(self._cache),
+        }
+
+    def clear(self) -> None:
+        '''Drop all cached addresses.'''
+        self._cache.clear()
+
+    async def _prefetch(self, family):
+        '''Resolve all hosts in prefetch, returning the exceptions raised.'''
+        results = await asyncio.gather(
+            *[self.resolve(host, 0, family) for host in self.prefetch],
+            return_exceptions=True,
+        )
+        return [result for result in results if isinstance(result, Exception)]
+
+    async def _resolve(self, host, family):
+        key = (host, family)
+        entry = self._cache.get(key)
+        if entry is not None and monotonic() < entry[0]:
+            self._hits += 1
+            return entry[1]
+        # Concurrent lookups of the same host share one query. Tasks are
+        # bound to a loop, and each Client sharing this Resolver has its own.
+        loop = asyncio.get_running_loop()
+        pending_key = (loop, host, family)
+        task = self._pending.get(pending_key)
+        if task is None:
+            self._misses += 1
+            task = loop.create_task(self._refresh(key))
+            self._pending[pending_key] = task
+            task.add_done_callback(lambda task: self._pending.pop(pending_key, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, key):
+        addrs, ttl = await self.lookup(*key)
+        addrs = self._interleave(addrs)
+        now = monotonic()
+        self._sweep(now)
+        self._cache[key] = (now + (self.ttl if ttl is None else ttl), addrs)
+        return addrs
+
+    def _sweep(self, now):
+        '''Drop expired entries, at most once every ttl seconds.'''
+        if now - self._last_sweep < self.ttl:
+            return
+        self._last_sweep = now
+        for key, entry in list(self._cache.items()):
+            if now >= entry[0]:
+                del self._cache[key]
+
+    def _static(self, host, family):
+        addrs = []
+        for ip in self.static[host]:
+            ip_family = socket.AF_INET6 if ipaddress.ip_address(ip).version == 6 else socket.AF_INET
+            if family in (socket.AF_UNSPEC, ip_family):
+                addrs.append(ResolveResult(hostname=host, host=ip, port=0, family=ip_family,
+                                           proto=0, flags=_NUMERIC_FLAGS))
+        if not addrs:
+            raise OSError(f'No address of family {family!r} for {host}')
+        return self._interleave(addrs)
+
+    def _interleave(self, addrs):
+        '''Alternate address families, starting with the first one (RFC 8305),
+        so that a connection attempt on the other family starts early.
+        '''
+        families = {}
+        for addr in addrs:
+            families.setdefault(addr['family'], []).append(addr)
+        if len(families) < 2:
+            return list(addrs)
+        return [addr for addr in chain.from_iterable(zip_longest(*families.values()))
+                if addr is not None]
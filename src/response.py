@@ -4,17 +4,46 @@ from __future__ import annotations
 
 __all__ = ['Response']
 
+import codecs
 import json
-from dataclasses import dataclass
-from typing import Optional
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
 
 import cchardet
 import html5lib
+import lxml.html
 from lxml import etree
 from multidict import CIMultiDictProxy
 from yarl import URL
 
 from .request import Jsonable, Request
+from .stats import Timing
+
+try:
+    import html5_parser
+except (ImportError, RuntimeError):
+    # html5-parser is optional. It raises RuntimeError on import
+    # if it is built against a different libxml2 than lxml.
+    html5_parser = None
+
+
+HTML_PARSERS = ('html5lib', 'lxml', 'html5-parser')
+
+
+# Bytes of body inspected before cchardet falls back to the whole body.
+SNIFF_SIZE = 64 * 1024
+SNIFF_CONFIDENCE = 0.9
+
+_CHARSET_RE = re.compile(r'''charset\s*=\s*["']?([\w.:-]+)''', re.IGNORECASE)
+_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
 
 
 @dataclass
@@ -30,6 +59,14 @@ class Response:
     request: Request
     meta: dict    # meta contained in the request.
 
+    path: Optional[Path] = None    # body is saved here if request.save_to is set.
+    html_parser: str = field(default='html5lib', repr=False, compare=False)
+    parsed: Any = field(default=None, repr=False, compare=False)    # result of request.parse.
+    timing: Optional[Timing] = field(default=None, repr=False, compare=False)
+
+    # Results of text(), json() and etree(), keyed by method and argument.
+    _cache: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
     def __repr__(self):
         return f'<Response {self.status} {self.url}>'
 
@@ -39,25 +76,118 @@ class Response:
     def text(self, encoding: Optional[str] = None) -> str:
         '''Response body in text.
 
-        If encoding is not set, Response will use cchardet to detect encoding.
-        If cchardet fails, 'utf-8' will be assumed.
+        If encoding is not set, Response will use the charset in Content-Type,
+        a byte order mark, or cchardet to detect encoding.
+        If all of them fail, 'utf-8' will be assumed. If the body can not be
+        decoded that way, cchardet over the whole body decides.
         '''
-        encoding = encoding or cchardet.detect(self.body)['encoding'] or 'utf-8'
-        return self.body.decode(encoding)
+        key = ('text', encoding)
+        if key not in self._cache:
+            if encoding is not None:
+                self._cache[key] = self.body.decode(encoding)
+            else:
+                try:
+                    self._cache[key] = self.body.decode(self._encoding())
+                except UnicodeDecodeError:
+                    # Content-Type or the prefix may be wrong about the
+                    # whole body, so let cchardet look at all of it.
+                    encoding = cchardet.detect(self.body)['encoding']
+                    if encoding is None:
+                        raise
+                    self._cache[('encoding',)] = encoding
+                    self._cache[key] = self.body.decode(encoding)
+        return self._cache[key]
 
     def json(self) -> Jsonable:
         '''Response body as json.
 
         Jsonable is defined as NewType('Jsonable', Any).
         '''
-        return json.loads(self.body)
+        key = ('json',)
+        if key not in self._cache:
+            self._cache[key] = json.loads(self.body)
+        return self._cache[key]
 
-    def etree(self, html: bool = True) -> etree._ElementTree:
+    def etree(self, html: bool = True, parser: Optional[str] = None) -> etree._ElementTree:
         '''Response body as lxml etree.
 
-        If html is True, body will be first processed by html5lib.
+        If html is True, body will be first processed by parser, which is one of
+        'html5lib', 'lxml' and 'html5-parser'. If parser is not set, html_parser
+        is used. html5lib is used if the chosen parser is not installed or fails.
         '''
-        if html:
-            return html5lib.parse(self.body, treebuilder='lxml', namespaceHTMLElements=False)
-        else:
-            return etree.fromstring(self.body).getroottree()
+        parser = parser or self.html_parser
+        if parser not in HTML_PARSERS:
+            raise ValueError(f'Expect parser in {HTML_PARSERS}, got {parser!r}.')
+        key = ('etree', html, parser if html else None)
+        if key not in self._cache:
+            if html:
+                tree = self._parse_html(parser)
+            else:
+                tree = etree.fromstring(self.body).getroottree()
+            self._cache[key] = tree
+        return self._cache[key]
+
+    def _parse_html(self, parser):
+        if parser == 'lxml':
+            try:
+                return lxml.html.document_fromstring(self.body).getroottree()
+            except etree.ParserError:
+                pass
+        elif parser == 'html5-parser' and html5_parser is not None:
+            root = html5_parser.parse(self.body, treebuilder='lxml', namespace_elements=False)
+            return root.getroottree()
+        return html5lib.parse(self.body, treebuilder='lxml', namespaceHTMLElements=False)
+
+    def _encoding(self):
+        key = ('encoding',)
+        if key not in self._cache:
+            self._cache[key] = self._detect_encoding()
+        return self._cache[key]
+
+    def _detect_encoding(self):
+        match = _CHARSET_RE.search(self.headers.get('Content-Type', ''))
+        if match:
+            try:
+                return codecs.lookup(match.group(1)).name
+            except LookupError:
+                pass
+        for bom, encoding in _BOMS:
+            if self.body.startswith(bom):
+                return encoding
+        # Most bodies are recognized from a prefix, which is much
+        # cheaper than running cchardet over a large body.
+        if len(self.body) > SNIFF_SIZE:
+            result = cchardet.detect(self.body[:SNIFF_SIZE])
+            if result['encoding'] and (result['confidence'] or 0) >= SNIFF_CONFIDENCE:
+                # An ASCII prefix says nothing about the rest of the body,
+                # which is most likely UTF-8, a superset of ASCII.
+                if result['encoding'].upper() == 'ASCII':
+                    return 'utf-8'
+                return result['encoding']
+        return cchardet.detect(self.body)['encoding'] or 'utf-8'
+
+
+def _run_parse(resp: Response, parse: Union[str, tuple, Callable]) -> Any:
+    '''Apply a Request.parse spec to resp. This runs in a worker process,
+    so both the argument and the result must be picklable.
+    '''
+    if parse == 'text':
+        return resp.text()
+    elif parse == 'json':
+        return resp.json()
+    elif isinstance(parse, tuple) and parse and parse[0] == 'etree-xpath':
+        tree = resp.etree()
+        return [[_plain(item) for item in tree.xpath(expr)] for expr in parse[1:]]
+    elif callable(parse):
+        return parse(resp)
+    raise ValueError(f'Expect parse to be "text", "json", ("etree-xpath", *exprs)'
+                     f' or a callable, got {parse!r}.')
+
+
+def _plain(item):
+    '''Turn an xpath result into a plain picklable value.'''
+    if isinstance(item, etree._Element):
+        return etree.tostring(item, encoding='unicode', with_tail=False)
+    elif isinstance(item, str):
+        return str(item)
+    return item
@@ -0,0 +1,70 @@
+'''The RetryPolicy class used in Client.'''
+
+from __future__ import annotations
+
+__all__ = ['RetryPolicy']
+
+import asyncio
+import random
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, FrozenSet, Optional, Tuple, Union
+
+from aiohttp import ClientConnectionError
+
+if TYPE_CHECKING:
+    from .response import Response
+
+
+@dataclass
+class RetryPolicy:
+    '''Decide whether a failed attempt is retried and how long to wait.
+
+    The number of retries is still given by retry in Client or Request.
+    Subclass RetryPolicy and override retryable() or backoff() to customize
+    the decision.
+    '''
+
+    backoff_base: float = 0.5
+    backoff_max: float = 30
+    jitter: bool = True
+
+    statuses: FrozenSet[int] = frozenset({429, 500, 502, 503, 504})
+    exceptions: Tuple[type, ...] = (asyncio.TimeoutError, ClientConnectionError)
+
+    # Every request adds budget to a shared balance and every retry takes
+    # one from it, so retries stay below that ratio of requests once the
+    # initial budget_reserve is used up. None disables the budget.
+    budget: Optional[float] = 0.2
+    budget_reserve: float = 10
+
+    _balance: float = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._balance = self.budget_reserve
+
+    def retryable(self, result: Union[Exception, Response]) -> bool:
+        '''Whether an attempt ending with result is worth retrying.'''
+        if isinstance(result, BaseException):
+            return isinstance(result, self.exceptions)
+        return result.status in self.statuses
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        '''Seconds to wait before retry number attempt (starting from 0).'''
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _deposit(self):
+        if self.budget is not None:
+            self._balance = min(self._balance + self.budget, self.budget_reserve)
+
+    def _withdraw(self):
+        if self.budget is None:
+            return True
+        if self._balance < 1:
+            return False
+        self._balance -= 1
+        return True
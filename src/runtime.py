@@ -0,0 +1,181 @@
+'''The Runtime class shared by Clients and WebSockets.'''
+
+from __future__ import annotations
+
+__all__ = ['Runtime']
+
+import asyncio
+import logging
+from concurrent.futures import wait
+from threading import Lock, Thread
+
+from aiohttp import TCPConnector
+
+
+class _Loop:
+    '''An event loop running forever in a background thread.'''
+
+    def __init__(self, name):
+        self.loop = asyncio.new_event_loop()
+        self.hosted = 0     # Instances running on this loop.
+        self.instances = set()
+        self.thread = Thread(target=self._main, name=name)
+        self.thread.start()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def _main(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.run_until_complete(self.loop.shutdown_default_executor())
+        finally:
+            self.loop.close()
+
+
+class _Hosted:
+    '''A coroutine running on a Runtime, which can be joined like a Thread.
+
+    stop makes the coroutine return, and may be called from any thread.
+    '''
+
+    def __init__(self, future, stop):
+        self._future = future
+        self.stop = stop
+
+    def join(self):
+        wait([self._future])
+
+    def is_alive(self):
+        return not self._future.done()
+
+
+class Runtime:
+    '''Event loops in background threads shared by many Clients and WebSockets.
+
+    By default, every Client and WebSocket runs its own event loop in its
+    own thread. Those created with a Runtime run on one of its threads
+    instead, the one hosting the fewest instances at that time. Clients
+    with share_connector in their setting also share a connection pool
+    with other such Clients on the same event loop and with the same pool
+    setting, whose limits are those of all these Clients added up.
+
+    Callbacks of instances on one thread run on the same event loop, so a
+    blocking callback holds back all of them.
+    '''
+
+    def __init__(self, threads: int = 1) -> None:
+        assert threads > 0, 'threads must be positive.'
+        self._name = self.__class__.__name__
+        self._logger = logging.getLogger(self._name)
+        self._lock = Lock()
+        self._loops = [_Loop(f'{self._name}-{i}') for i in range(threads)]
+        # (loop, options without limits) -> [connector, limits of every user]
+        self._connectors = {}
+        self._logger.info(f'start {threads} threads')
+
+    def stats(self) -> dict:
+        '''Number of instances hosted by every thread, and of shared connectors.'''
+        return {
+            'hosted': [loop.hosted for loop in self._loops],
+            'connectors': len(self._connectors),
+        }
+
+    def close(self) -> None:
+        '''Close shared connectors and stop all threads.
+
+        Instances hosted by the Runtime should be closed first. Those still
+        running are stopped without waiting for pending requests, and their
+        own close() then returns at once.
+        '''
+        for loop in self._loops:
+            with self._lock:
+                instances = list(loop.instances)
+            if instances:
+                self._logger.warning(f'stop {len(instances)} instances still running')
+                for instance in instances:
+                    instance.stop()
+                for instance in instances:
+                    instance.join()
+            connectors = [entry[0] for key, entry in list(self._connectors.items())
+                          if key[0] is loop.loop]
+            if connectors:
+                asyncio.run_coroutine_threadsafe(self._close_connectors(connectors),
+                                                 loop.loop).result()
+            loop.stop()
+        self._connectors.clear()
+        self._logger.info('close')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _host(self, coro, stop):
+        '''Run coro on the least loaded event loop, with stop making it return.'''
+        with self._lock:
+            loop = min(self._loops, key=lambda loop: loop.hosted)
+            loop.hosted += 1
+            future = asyncio.run_coroutine_threadsafe(self._run(loop, coro), loop.loop)
+            instance = _Hosted(future, stop)
+            loop.instances.add(instance)
+        future.add_done_callback(lambda future: self._forget(loop, instance))
+        return instance
+
+    def _forget(self, loop, instance):
+        with self._lock:
+            loop.instances.discard(instance)
+
+    async def _run(self, loop, coro):
+        try:
+            await coro
+        finally:
+            with self._lock:
+                loop.hosted -= 1
+
+    def _acquire_connector(self, options):
+        '''Return the shared TCPConnector with options on the running loop.
+
+        Its limits grow by those in options, so that every Client using it
+        gets the connections its own pool setting asks for.
+        '''
+        options = dict(options)
+        limits = (options.pop('limit'), options.pop('limit_per_host'))
+        key = (asyncio.get_running_loop(), tuple(sorted(options.items())))
+        entry = self._connectors.get(key)
+        if entry is None:
+            entry = self._connectors[key] = [TCPConnector(**options), []]
+        entry[1].append(limits)
+        self._resize(entry)
+        return entry[0]
+
+    async def _release_connector(self, connector, options):
+        '''Shrink the connector by the limits in options, and close it once no Client uses it.'''
+        limits = (options['limit'], options['limit_per_host'])
+        for key, entry in list(self._connectors.items()):
+            if entry[0] is connector:
+                entry[1].remove(limits)
+                if entry[1]:
+                    self._resize(entry)
+                else:
+                    del self._connectors[key]
+                    await connector.close()
+                return
+
+    @staticmethod
+    def _resize(entry):
+        connector, limits = entry
+        # 0 means no limit, which no other user can narrow down.
+        limit, limit_per_host = [0 if 0 in values else sum(values) for values in zip(*limits)]
+        # TCPConnector takes limits only in its constructor.
+        connector._limit = limit
+        connector._limit_per_host = limit_per_host
+
+    @staticmethod
+    async def _close_connectors(connectors):
+        for connector in connectors:
+            await connector.close()
@@ -0,0 +1,120 @@
+'''Timing and statistics of requests made by Client.'''
+
+from __future__ import annotations
+
+__all__ = ['Timing']
+
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import dataclass
+from math import inf
+
+
+# Upper bounds in seconds of the buckets of latency histograms.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, inf)
+
+
+@dataclass
+class Timing:
+    '''Where the time of a request went, in seconds.
+
+    Phases of all attempts are summed up.
+    '''
+
+    queue: float = 0       # waiting for a concurrency slot or a pooled connection.
+    throttle: float = 0    # waiting for rate limits and Retry-After.
+    backoff: float = 0     # waiting between attempts.
+    dns: float = 0
+    connect: float = 0     # TCP and TLS handshakes.
+    ttfb: float = 0        # from sending the request to receiving response headers.
+    transfer: float = 0    # receiving the response body.
+    total: float = 0
+    attempts: int = 0
+
+
+class _Histogram:
+    '''Counts of values in LATENCY_BUCKETS.'''
+
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0
+
+    def add(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        '''Upper bound of the bucket holding quantile q, or None if empty.'''
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return inf
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': dict(zip(LATENCY_BUCKETS, self.counts)),
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+        }
+
+
+class _HostStats:
+
+    __slots__ = ('requests', 'errors', 'attempts', 'statuses', 'bytes', 'latency', 'ttfb')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.attempts = 0
+        self.statuses = Counter()
+        self.bytes = 0
+        self.latency = _Histogram()
+        self.ttfb = _Histogram()
+
+    def snapshot(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'attempts': self.attempts,
+            'statuses': dict(self.statuses),
+            'bytes': self.bytes,
+            'latency': self.latency.snapshot(),
+            'ttfb': self.ttfb.snapshot(),
+        }
+
+
+class _Stats:
+    '''Counters and latency histograms per host.'''
+
+    def __init__(self):
+        self._hosts = {}
+
+    def record(self, host, resp):
+        stats = self._hosts.get(host)
+        if stats is None:
+            stats = self._hosts[host] = _HostStats()
+        stats.requests += 1
+        if resp.status == -1:
+            stats.errors += 1
+        else:
+            stats.statuses[resp.status] += 1
+        stats.bytes += len(resp.body)
+        stats.attempts += resp.timing.attempts
+        stats.latency.add(resp.timing.total)
+        if resp.timing.attempts:
+            stats.ttfb.add(resp.timing.ttfb / resp.timing.attempts)
+
+    def snapshot(self):
+        return {host: stats.snapshot() for host, stats in self._hosts.items()}
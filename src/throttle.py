@@ -0,0 +1,238 @@
+'''Throttle used in Client.'''
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+
+class TokenBucket:
+    '''Token bucket used to limit the number of requests per second.
+
+    Callers reserve a token and sleep until it becomes available, so waiting
+    callers are served in FIFO order. If rate is None, the bucket never runs
+    out of tokens but can still be paused.
+    '''
+
+    __slots__ = ('rate', 'capacity', '_tokens', '_last')
+
+    def __init__(self, rate: Optional[float] = None, capacity: float = 1) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = 0    # Tokens are only refilled after this time.
+
+    def reserve(self, now: float) -> float:
+        '''Take one token and return the delay before it may be used.'''
+        self._refill(now)
+        delay = max(self._last - now, 0)
+        if self.rate is not None:
+            self._tokens -= 1
+            if self._tokens < 0:
+                delay += -self._tokens / self.rate
+        return delay
+
+    def pause(self, now: float, delay: float) -> None:
+        '''Hand out no tokens during the next delay seconds.'''
+        self._refill(now)
+        self._tokens = min(self._tokens, 0)
+        self._last = max(self._last, now + delay)
+
+    def paused(self, now: float) -> bool:
+        return self._last > now
+
+    @property
+    def resumes(self) -> float:
+        '''The time when the bucket is no longer paused.'''
+        return self._last
+
+    def _refill(self, now):
+        if self.rate is not None and now > self._last:
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+
+
+class _Host:
+    '''Scheduling state of one host.'''
+
+    __slots__ = ('name', 'limit', 'weight', 'bucket', 'credit', 'active', 'waiters',
+                 'scheduled', 'idle_since')
+
+    def __init__(self, name, limit, weight, rate):
+        self.name = name
+        self.limit = limit
+        self.weight = weight
+        self.bucket = TokenBucket(rate)
+        self.credit = weight    # Slots left for this host in the current round.
+        self.active = 0
+        self.waiters = deque()
+        self.scheduled = False  # Whether the host is in the round-robin ring.
+        self.idle_since = None
+
+    def __repr__(self):
+        return f'<Host {self.name} {self.active}/{self.limit} waiting={len(self.waiters)}>'
+
+
+class Throttle:
+    '''Throttle used to control the maximum number of concurrent requests
+    and the number of requests per second.
+
+    Free slots are granted to waiting hosts in weighted round-robin order,
+    so a host with a large backlog cannot starve the others. Per-host
+    state is kept while the host is in use and evicted after it has been
+    idle for idle_timeout seconds.
+    '''
+
+    def __init__(self, concur: int, concur_per_host: int,
+                 hosts: Optional[dict] = None,
+                 rate: Optional[float] = None, rate_per_host: Optional[float] = None,
+                 idle_timeout: float = 60) -> None:
+        # concur is the maximum number of total concurrent requests.
+        # concur_per_host is the maximum number of concurrent requests towards one host.
+        # hosts maps a host to its own {'concurrency': int, 'weight': int, 'rate': float}.
+        # rate and rate_per_host are the maximum numbers of requests per second.
+        self._concur = concur
+        self._concur_per_host = concur_per_host
+        self._overrides = hosts or {}
+        self._rate_per_host = rate_per_host
+        self._bucket = TokenBucket(rate)
+        self._idle_timeout = idle_timeout
+        self._active = 0
+        self._hosts = {}
+        self._ring = deque()
+        self._wakeup = None     # Dispatch again once a paused host resumes.
+        self._last_sweep = 0
+
+    @asynccontextmanager
+    async def request(self, host):
+        '''This method yield when both concurrent limits and both rate limits are satisfied.
+
+        The seconds spent waiting for rate limits are yielded.
+        '''
+        # Wait for tokens before taking a slot, so that a rate limited
+        # host does not hold slots other hosts could use.
+        now = asyncio.get_running_loop().time()
+        state = self._get_host(host)
+        delay = max(state.bucket.reserve(now), self._bucket.reserve(now))
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self._mark_idle(state)
+                raise
+        state = await self._acquire(host)
+        try:
+            yield delay
+        finally:
+            self._release(state)
+
+    def pause(self, host: str, delay: float) -> None:
+        '''Send no more requests to host during the next delay seconds.'''
+        now = asyncio.get_running_loop().time()
+        self._get_host(host).bucket.pause(now, delay)
+
+    def _get_host(self, name):
+        state = self._hosts.get(name)
+        if state is None:
+            override = self._overrides.get(name, {})
+            state = _Host(name,
+                          override.get('concurrency', self._concur_per_host),
+                          override.get('weight', 1),
+                          override.get('rate', self._rate_per_host))
+            self._hosts[name] = state
+        state.idle_since = None
+        return state
+
+    async def _acquire(self, name):
+        state = self._get_host(name)
+        now = asyncio.get_running_loop().time()
+        if (self._active < self._concur and state.active < state.limit
+                and not state.waiters and not state.bucket.paused(now)):
+            state.active += 1
+            self._active += 1
+            return state
+        fut = asyncio.get_running_loop().create_future()
+        state.waiters.append(fut)
+        if not state.scheduled:
+            state.scheduled = True
+            self._ring.append(state)
+        # Slots may be free if earlier waiters of this host were cancelled.
+        self._dispatch()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # The slot was granted right before cancellation.
+                self._release(state)
+            raise
+        return state
+
+    def _release(self, state):
+        state.active -= 1
+        self._active -= 1
+        self._mark_idle(state)
+        self._dispatch()
+        self._sweep()
+
+    def _dispatch(self):
+        '''Grant free slots to waiting hosts in weighted round-robin order.
+
+        Hosts paused after their requests started waiting are skipped until
+        the pause ends.
+        '''
+        now = asyncio.get_running_loop().time()
+        blocked = 0
+        while self._active < self._concur and blocked < len(self._ring):
+            state = self._ring[0]
+            if not state.waiters:
+                self._ring.popleft()
+                state.scheduled = False
+                self._mark_idle(state)
+                continue
+            paused = state.bucket.paused(now)
+            if paused:
+                self._wake_at(state.bucket.resumes)
+            if paused or state.active >= state.limit:
+                self._ring.rotate(-1)
+                blocked += 1
+                continue
+            fut = state.waiters.popleft()
+            if fut.done():
+                # The waiter has been cancelled.
+                continue
+            fut.set_result(None)
+            state.active += 1
+            self._active += 1
+            blocked = 0
+            state.credit -= 1
+            if state.credit <= 0:
+                state.credit = state.weight
+                self._ring.rotate(-1)
+
+    def _wake_at(self, when):
+        if self._wakeup is not None:
+            if self._wakeup.when() <= when:
+                return
+            self._wakeup.cancel()
+        self._wakeup = asyncio.get_running_loop().call_at(when, self._wake)
+
+    def _wake(self):
+        self._wakeup = None
+        self._dispatch()
+
+    def _mark_idle(self, state):
+        if not state.active and not state.waiters:
+            state.idle_since = asyncio.get_running_loop().time()
+
+    def _sweep(self):
+        '''Evict hosts that have been idle for more than idle_timeout seconds.'''
+        now = asyncio.get_running_loop().time()
+        if now - self._last_sweep < self._idle_timeout:
+            return
+        self._last_sweep = now
+        for name, state in list(self._hosts.items()):
+            if (state.idle_since is not None and now - state.idle_since > self._idle_timeout
+                    and not state.bucket.paused(now)):
+                del self._hosts[name]
@@ -8,20 +8,441 @@ import asyncio
 import json
 import logging
 import reprlib
-from queue import Empty, Full, Queue
-from threading import Thread
-from time import sleep
-from typing import Callable, List, Optional, Union
+import struct
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from inspect import isawaitable, signature
+from collections import deque
+from queue import Empty, Full
+from threading import Condition, Event, Thread
+from typing import Callable, Hashable, List, Optional, Tuple, Union
 
-from aiohttp import ClientSession, WSMsgType, web
+from aiohttp import ClientError, ClientSession, ClientWSTimeout, WSMsgType, web
 
 from .request import Jsonable
+from .retry import RetryPolicy
+from .runtime import Runtime
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional.
+    orjson = None
+
+
+# What WebSocketServer does when the queue of a client is full.
+SLOW_CONSUMER_POLICIES = ('drop', 'disconnect')
+
+# What send() does when the queue is full.
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block', 'raise', 'coalesce')
+
+# Executors which callbacks may run in, besides an Executor instance.
+EXECUTORS = ('thread', 'process')
+
+# Marks the end of received items in a _Dispatcher queue.
+_STOP = object()
+
+# The default maximum bytes of items grouped into one frame.
+BATCH_SIZE = 16 * 1024
+
+# The WebSocket subprotocol under which both ends send batch frames.
+BATCH_PROTOCOL = 'requestkit.batch'
+
+# A batch frame starts with its version, and every item in it
+# starts with its kind and length.
+_BATCH_VERSION = b'\x01'
+_RECORD = struct.Struct('!BI')
+_TEXT, _BINARY = 0, 1
+
+
+if orjson is not None:
+    def _dumps(obj):
+        try:
+            return orjson.dumps(obj).decode()
+        except TypeError:
+            # orjson rejects some items json accepts, such as non-str dict keys.
+            return json.dumps(obj)
+
+    _loads = orjson.loads
+else:
+    _dumps = json.dumps
+    _loads = json.loads
+
+
+def _pack(records):
+    '''Pack (is_text, data) pairs into the payload of a batch frame.'''
+    parts = [_BATCH_VERSION]
+    for is_text, data in records:
+        if is_text:
+            data = data.encode()
+        parts.append(_RECORD.pack(_TEXT if is_text else _BINARY, len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def _unpack(payload):
+    '''Unpack the payload of a batch frame into (is_text, data) pairs.
+
+    Raise ValueError if payload is not a valid batch frame.
+    '''
+    if payload[:1] != _BATCH_VERSION:
+        raise ValueError('unknown batch frame version')
+    records = []
+    offset = 1
+    while offset < len(payload):
+        if offset + _RECORD.size > len(payload):
+            raise ValueError('truncated batch frame')
+        kind, size = _RECORD.unpack_from(payload, offset)
+        offset += _RECORD.size
+        if kind not in (_TEXT, _BINARY) or offset + size > len(payload):
+            raise ValueError('malformed batch frame')
+        data = payload[offset:offset + size]
+        offset += size
+        records.append((True, data.decode()) if kind == _TEXT else (False, data))
+    return records
+
+
+class _Channel:
+    '''Items waiting to be sent through one connection.
+
+    Items are put from any thread and sent by write() on the event loop.
+    On connections agreeing on batching, items are grouped into batch frames
+    until they reach batch_size bytes, and each item waits at most
+    batch_delay seconds.
+
+    overflow decides what put() does when maxsize items are queued, see
+    OVERFLOW_POLICIES. With 'coalesce', an item with a key replaces the
+    queued item with the same key. on_watermark(True) is called when the
+    queue grows to the high watermark, and on_watermark(False) when it
+    shrinks back to the low one.
+
+    If replay is set, up to that many items written to a connection are
+    kept until ack() confirms the peer has read them, and replay() queues
+    them again for the next connection.
+    '''
+
+    def __init__(self, maxsize, logger,
+                 batch_delay=None, batch_size=BATCH_SIZE, *,
+                 overflow='drop_oldest', timeout=None,
+                 watermarks=None, on_watermark=None, replay=0):
+        # Entries are [key, item] lists, so that coalescing can replace
+        # the item in place.
+        self._items = deque()
+        self._keys = {}
+        self._maxsize = maxsize
+        self._cond = Condition()
+        self._unfinished = 0    # Items put but not yet sent or dropped.
+        self._logger = logger
+        self._batch_delay = batch_delay
+        self._batch_size = batch_size
+        self._overflow = overflow
+        self._timeout = timeout
+        self._high, self._low = watermarks or (None, None)
+        self._on_watermark = on_watermark
+        self._above = False
+        self._unacked = deque(maxlen=replay) if replay else None
+        self._written = 0       # Items written to connections, used as their sequence numbers.
+        self._sent = 0
+        self._dropped = 0
+        self._coalesced = 0
+        self._replayed = 0
+        self._running = True
+        # write() sets _idle before it waits for _wakeup, so that put()
+        # only needs to wake it up through the event loop when it is idle.
+        self._event_loop = None
+        self._wakeup = None
+        self._idle = False
+
+    def put(self, item, key=None, drop=True):
+        '''Queue an item. If the queue is full, apply the overflow policy,
+        or return False without queuing if drop is False.
+
+        Raise queue.Full if the policy is 'raise', or 'block' and the
+        timeout expires.
+        '''
+        with self._cond:
+            if not self._running:
+                return True
+            if key is not None and self._overflow == 'coalesce':
+                entry = self._keys.get(key)
+                if entry is not None:
+                    entry[1] = item
+                    self._coalesced += 1
+                    return True
+            if self._maxsize and len(self._items) >= self._maxsize:
+                if not drop:
+                    return False
+                if not self._make_room():
+                    self._dropped += 1
+                    return True
+            entry = [key, item]
+            self._items.append(entry)
+            if key is not None and self._overflow == 'coalesce':
+                self._keys[key] = entry
+            self._unfinished += 1
+            crossed = (self._high is not None and not self._above
+                       and len(self._items) >= self._high)
+            if crossed:
+                self._above = True
+        if crossed:
+            self._on_watermark(True)
+        if self._idle:
+            self._wake()
+        return True
+
+    def join(self):
+        with self._cond:
+            self._cond.wait_for(lambda: not self._unfinished)
+
+    def stats(self):
+        return {
+            'depth': len(self._items),
+            'sent': self._sent,
+            'dropped': self._dropped,
+            'coalesced': self._coalesced,
+            'replayed': self._replayed,
+        }
+
+    def written(self):
+        '''Sequence number of the next item written to a connection.'''
+        return self._written
+
+    def ack(self, written):
+        '''Forget items written before written() returned the given number.'''
+        if self._unacked is not None:
+            while self._unacked and self._unacked[0][0] < written:
+                self._unacked.popleft()
+
+    def replay(self):
+        '''Queue items not acknowledged yet before other items.'''
+        if not self._unacked:
+            return
+        with self._cond:
+            entries = [[None, item] for _, item in self._unacked]
+            self._items.extendleft(reversed(entries))
+            self._unfinished += len(entries)
+            self._replayed += len(entries)
+            self._unacked.clear()
+        if self._idle:
+            self._wake()
+
+    def close(self):
+        '''Make write() return. May be called from any thread.'''
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._wake()
+
+    def discard(self):
+        '''Drop all queued items, so that join() does not wait for them.'''
+        with self._cond:
+            self._running = False
+            self._unfinished -= len(self._items)
+            self._items.clear()
+            self._keys.clear()
+            self._cond.notify_all()
+
+    def _make_room(self):
+        '''Return whether there is room for a new item. Called with _cond held.'''
+        if self._overflow in ('drop_oldest', 'coalesce'):
+            self._forget(self._items.popleft())
+            self._unfinished -= 1
+            self._dropped += 1
+            return True
+        if self._overflow == 'drop_newest':
+            return False
+        if self._overflow == 'raise':
+            raise Full
+        if self._on_event_loop():
+            # Waiting here would stop write() from ever taking items.
+            raise Full
+        # Wait for write() to take items.
+        if not self._cond.wait_for(
+                lambda: len(self._items) < self._maxsize or not self._running,
+                self._timeout):
+            raise Full
+        return self._running
+
+    def _on_event_loop(self):
+        try:
+            return asyncio.get_running_loop() is self._event_loop
+        except RuntimeError:
+            return False
+
+    def _forget(self, entry):
+        key = entry[0]
+        if key is not None and self._keys.get(key) is entry:
+            del self._keys[key]
+
+    def _get(self):
+        '''Take the first item, or raise queue.Empty.'''
+        with self._cond:
+            if not self._items:
+                raise Empty
+            entry = self._items.popleft()
+            self._forget(entry)
+            self._cond.notify_all()
+            crossed = self._above and len(self._items) <= self._low
+            if crossed:
+                self._above = False
+        if crossed:
+            self._on_watermark(False)
+        return entry[1]
+
+    def _done(self, items, sent):
+        '''Mark items taken by _get() as finished.'''
+        if self._unacked is not None:
+            # Items failed to write are kept as well, since the peer may
+            # have read part of them.
+            self._unacked.extend(enumerate(items, self._written))
+        self._written += len(items)
+        with self._cond:
+            self._unfinished -= len(items)
+            if sent:
+                self._sent += len(items)
+            if not self._unfinished:
+                self._cond.notify_all()
+
+    async def write(self, ws, batch=False):
+        '''Send queued items until close() is called.
+
+        Items are grouped into batch frames only if batch is True, that is
+        both ends agreed on BATCH_PROTOCOL.
+        '''
+        self._event_loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        while self._running:
+            try:
+                item = self._get()
+            except Empty:
+                await self._wait()
+                continue
+            if batch:
+                await self._write_batch(ws, item)
+                continue
+            # Items already queued are sent back to back, and only wait
+            # for the transport when its buffer is full.
+            self._logger.debug(f'send {reprlib.repr(item)}')
+            sent = False
+            try:
+                if isinstance(item, bytes):
+                    await ws.send_bytes(item)
+                else:
+                    await ws.send_str(item)
+                sent = True
+            finally:
+                self._done([item], sent)
+
+    async def _write_batch(self, ws, item):
+        '''Send item and the items following it within the budget as one frame.'''
+        deadline = self._event_loop.time() + self._batch_delay
+        records = []
+        size = 0
+        sent = False
+        try:
+            while True:
+                self._logger.debug(f'send {reprlib.repr(item)}')
+                is_text = not isinstance(item, bytes)
+                records.append((is_text, item))
+                size += len(records[-1][1])
+                item = None
+                while item is None and size < self._batch_size and self._running:
+                    try:
+                        item = self._get()
+                    except Empty:
+                        timeout = deadline - self._event_loop.time()
+                        if timeout <= 0:
+                            break
+                        await self._wait(timeout)
+                if item is None:
+                    break
+            await ws.send_bytes(_pack(records))
+            sent = True
+        finally:
+            self._done([data for _, data in records], sent)
+
+    async def _wait(self, timeout=None):
+        '''Wait until put() or close() is called, or timeout seconds pass.'''
+        self._idle = True
+        # Check again, since put() may have missed _idle.
+        if not self._items and self._running:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._wakeup.clear()
+        self._idle = False
+
+    def _wake(self):
+        if self._event_loop is not None:
+            try:
+                self._event_loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                # The event loop has already been closed.
+                pass
+
+
+class _Dispatcher:
+    '''Run callbacks of received items off the reader.
+
+    Items of one type are passed to their callbacks in the order they
+    arrive, while items of different types are handled concurrently.
+    Coroutine functions run on the event loop, and other callbacks run
+    in executor. At most maxsize items of each type wait, after which
+    put() blocks, so that the connection is no longer read.
+    '''
+
+    def __init__(self, websocket, callbacks, executor, maxsize, reply, logger):
+        self._websocket = websocket
+        self._callbacks = callbacks
+        self._executor = executor
+        # Callbacks in another process can not reach the WebSocket,
+        # so their results are sent back through reply instead.
+        self._in_process = isinstance(executor, ProcessPoolExecutor)
+        self._reply = reply
+        self._logger = logger
+        self._queues = {key: asyncio.Queue(maxsize) for key in callbacks}
+        self._tasks = [asyncio.ensure_future(self._run(key)) for key in callbacks]
+
+    async def put(self, key, data):
+        if self._callbacks[key]:
+            await self._queues[key].put(data)
+
+    async def close(self):
+        '''Wait until items already received are handled.'''
+        for queue in self._queues.values():
+            await queue.put(_STOP)
+        await asyncio.gather(*self._tasks)
+
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+
+    async def _run(self, key):
+        queue = self._queues[key]
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await queue.get()
+            if data is _STOP:
+                return
+            for cb in self._callbacks[key]:
+                try:
+                    if asyncio.iscoroutinefunction(cb):
+                        await cb(data, self._websocket)
+                    elif self._in_process:
+                        result = await loop.run_in_executor(self._executor, cb, data, None)
+                        if result is not None:
+                            self._reply(result)
+                    else:
+                        await loop.run_in_executor(self._executor, cb, data, self._websocket)
+                except Exception:
+                    self._logger.exception(f'callback {cb} failed')
 
 
 class _AbstractWebSocket:
     '''Abstract WebSocket Class
 
-    All its subclasses should implement _async_main method.
+    All its subclasses should implement _setup, _stop and _async_main methods.
     '''
 
     def __init__(self, *,
@@ -29,7 +450,26 @@ class _AbstractWebSocket:
                  port: Optional[int] = None,
                  route: str = '/ws',
                  maxsize: int = 0,
-                 callbacks: Optional[List[Callable]] = None) -> None:
+                 callbacks: Optional[List[Callable]] = None,
+                 executor: Union[None, str, Executor] = None,
+                 max_pending: int = 100,
+                 dumps: Optional[Callable[[Jsonable], str]] = None,
+                 loads: Optional[Callable[[str], Jsonable]] = None,
+                 compress: bool = False,
+                 batch_delay: Optional[float] = None,
+                 batch_size: int = BATCH_SIZE,
+                 overflow: str = 'drop_oldest',
+                 send_timeout: Optional[float] = None,
+                 watermarks: Optional[Tuple[int, int]] = None,
+                 on_watermark: Optional[Callable] = None,
+                 heartbeat: Optional[float] = None,
+                 on_connect: Optional[Callable] = None,
+                 on_disconnect: Optional[Callable] = None,
+                 runtime: Optional[Runtime] = None) -> None:
+        assert overflow in OVERFLOW_POLICIES, f'overflow must be one of {OVERFLOW_POLICIES}.'
+        assert watermarks is None or (on_watermark is not None
+                                      and watermarks[0] >= watermarks[1]), \
+            'watermarks must be (high, low) with high >= low, and need on_watermark.'
         self._name = self.__class__.__name__
         self._logger = logging.getLogger(f'{self._name}')
         self._host = host
@@ -37,30 +477,47 @@ class _AbstractWebSocket:
         self._route = route
         self._maxsize = maxsize
         self._callbacks = self._prepare_callbacks(callbacks)
-        self._queue = Queue(self._maxsize)
+        self._executor, self._own_executor = self._prepare_executor(executor)
+        self._max_pending = max_pending
+        self._dumps = dumps or _dumps
+        self._loads = loads or _loads
+        self._compress = compress
+        self._batch_delay = batch_delay
+        self._batch_size = batch_size
+        self._overflow = overflow
+        self._send_timeout = send_timeout
+        self._watermarks = watermarks
+        self._on_watermark = on_watermark
+        self._heartbeat = heartbeat
+        self._on_connect = on_connect
+        self._on_disconnect = on_disconnect
         self._running = True
-        self._stopped = False
-        self._thread = Thread(target=self._main)
-        self._thread.start()
+        self._event_loop = None
+        # Set when the server is listening or the client is connected,
+        # and also when the thread exits, with _error if it failed.
+        self._ready = Event()
+        self._exited = False
+        self._error = None
+        self._setup()
+        if runtime is not None:
+            self._thread = runtime._host(self._run(), self._shutdown)
+        else:
+            self._thread = Thread(target=self._main)
+            self._thread.start()
 
-    def send(self, item: Union[str, bytes, Jsonable]) -> None:
-        '''Instruct WebSocket to send a item.'''
-        try:
-            self._queue.put_nowait(item)
-        except Full:
-            self._queue.get_nowait()
-            self._queue.task_done()
-            self._queue.put_nowait(item)
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        '''Block until the server is listening or the client is connected.
 
-    def join(self) -> None:
-        '''Block until all items are actually sent.'''
-        self._queue.join()
+        Return False if timeout expires or the WebSocket has stopped.
+        '''
+        return self._ready.wait(timeout) and not self._exited
 
     def close(self) -> None:
         '''Close WebSocket.'''
-        self._running = False
-        while self._thread.is_alive():
-            sleep(0.1)
+        self._shutdown()
+        self._thread.join()
+        if self._own_executor:
+            self._executor.shutdown()
 
     def __enter__(self):
         return self
@@ -87,83 +544,455 @@ class _AbstractWebSocket:
                                        ' type: str, bytes, or Jsonable.')
         return cb_dict
 
+    def _prepare_executor(self, executor):
+        '''Return the executor for callbacks and whether it is owned by us.'''
+        if executor is None or isinstance(executor, Executor):
+            return executor, False
+        assert executor in EXECUTORS, f'executor must be one of {EXECUTORS} or an Executor.'
+        if executor == 'thread':
+            return ThreadPoolExecutor(thread_name_prefix=self._name), True
+        return ProcessPoolExecutor(), True
+
+    def _make_channel(self, client_id=None, **kwargs):
+        on_watermark = None
+        if self._on_watermark is not None:
+            on_watermark = partial(self._bind(self._on_watermark, client_id), self)
+        return _Channel(self._maxsize, self._logger, self._batch_delay, self._batch_size,
+                        overflow=self._overflow, timeout=self._send_timeout,
+                        watermarks=self._watermarks, on_watermark=on_watermark, **kwargs)
+
+    def _protocols(self):
+        '''Subprotocols offered to the peer, batching only if batch_delay is set.'''
+        return (BATCH_PROTOCOL,) if self._batch_delay is not None else ()
+
+    def _serialize(self, item):
+        '''Serialize Jsonable items, so that errors reach the caller rather than the writer.'''
+        return item if isinstance(item, (str, bytes)) else self._dumps(item)
+
+    def _hook(self, cb, client_id=None):
+        '''Call a connect or disconnect hook, logging its exception.'''
+        if cb is not None:
+            try:
+                self._bind(cb, client_id)(self)
+            except Exception:
+                self._logger.exception(f'hook {cb} failed')
+
+    @staticmethod
+    def _bind(cb, client_id):
+        '''Pass client_id to cb if it takes it.'''
+        if client_id is not None and 'client_id' in signature(cb).parameters:
+            return partial(cb, client_id=client_id)
+        return cb
+
+    def _shutdown(self):
+        self._running = False
+        self._stop()
+
     def _main(self):
-        asyncio.run(self._async_main())
+        asyncio.run(self._run())
+
+    async def _run(self):
+        try:
+            await self._async_main()
+        except Exception as exc:
+            self._error = exc
+            self._logger.error('unexpected exception', exc_info=exc)
+        finally:
+            self._exited = True
+            self._ready.set()
+
+    def _setup(self):
+        '''Subclasses should set up their state here, before the thread starts.'''
+        raise NotImplementedError
+
+    def _stop(self):
+        '''Subclasses should make _async_main return. Called from any thread.'''
+        raise NotImplementedError
 
     async def _async_main(self):
         '''Subclasses should use _loop method to implement this method.'''
         raise NotImplementedError
 
-    async def _loop(self, ws):
-        self._logger.info('start')
-        self._logger.info(f'callbacks: {self._callbacks}')
-        while self._running:
-            # Get items and process them.
-            try:
-                msg = await ws.receive(timeout=0.05)
-            except asyncio.TimeoutError:
-                pass
-            else:
-                data = msg.data
-                if data is not None:
-                    self._logger.debug(f'receive {reprlib.repr(data)}')
+    async def _loop(self, ws, channel, callbacks, reply, *others, batch=False):
+        reader = asyncio.ensure_future(self._reader(ws, callbacks, reply, batch))
+        writer = asyncio.ensure_future(channel.write(ws, batch))
+        # The reader returns when the peer closes the connection,
+        # and the writer returns when the channel is closed. Other
+        # coroutines may end the connection by returning as well.
+        others = [asyncio.ensure_future(other) for other in others]
+        done, pending = await asyncio.wait([reader, writer, *others],
+                                           return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in done:
+            if task.exception() is not None:
+                self._logger.error('unexpected exception', exc_info=task.exception())
+        await ws.close()
+
+    def _on_pong(self, data):
+        '''Subclasses disabling autoping may override this to handle pongs.'''
+
+    def _on_receive(self):
+        '''Subclasses may override this to learn that a message arrived.'''
+
+    async def _reader(self, ws, callbacks, reply, batch):
+        '''Pass received items to callbacks until the connection is closed.
+
+        If batch is True, binary frames are batch frames.
+
+        Without an executor, callbacks run here one after another, and
+        reply is only used by a _Dispatcher.
+        '''
+        dispatcher = None
+        if self._executor is not None:
+            dispatcher = _Dispatcher(self, callbacks, self._executor,
+                                     self._max_pending, reply, self._logger)
+        try:
+            async for msg in ws:
                 if msg.type == WSMsgType.TEXT:
-                    try:
-                        data = json.loads(data)
-                    except ValueError:
-                        for cb in self._callbacks['str']:
-                            cb(data, self)
-                    else:
-                        for cb in self._callbacks['Jsonable']:
-                            cb(data, self)
+                    records = [(True, msg.data)]
                 elif msg.type == WSMsgType.BINARY:
-                    for cb in self._callbacks['bytes']:
-                        cb(data, self)
-            # Send items.
-            try:
-                item = self._queue.get_nowait()
-            except Empty:
-                pass
-            else:
-                self._logger.debug(f'send {reprlib.repr(item)}')
-                if isinstance(item, str):
-                    await ws.send_str(item)
-                elif isinstance(item, bytes):
-                    await ws.send_bytes(item)
+                    if batch:
+                        try:
+                            records = _unpack(msg.data)
+                        except ValueError as exc:
+                            self._logger.error(f'drop invalid batch frame: {exc}')
+                            continue
+                    else:
+                        records = [(False, msg.data)]
+                elif msg.type == WSMsgType.PING:
+                    await ws.pong(msg.data)
+                    continue
+                elif msg.type == WSMsgType.PONG:
+                    self._on_pong(msg.data)
+                    continue
                 else:
-                    await ws.send_json(item)
-                self._queue.task_done()
-        await ws.close()
-        self._logger.info('close')
-        self._stopped = True
+                    continue
+                self._on_receive()
+                for is_text, data in records:
+                    self._logger.debug(f'receive {reprlib.repr(data)}')
+                    key = 'bytes'
+                    # Only try JSON if someone is interested in it.
+                    if is_text:
+                        key = 'str'
+                        if callbacks['Jsonable']:
+                            try:
+                                data = self._loads(data)
+                            except ValueError:
+                                pass
+                            else:
+                                key = 'Jsonable'
+                    if dispatcher is not None:
+                        await dispatcher.put(key, data)
+                        continue
+                    for cb in callbacks[key]:
+                        result = cb(data, self)
+                        if isawaitable(result):
+                            await result
+            if dispatcher is not None:
+                await dispatcher.close()
+        finally:
+            if dispatcher is not None:
+                dispatcher.cancel()
 
 
 class WebSocketServer(_AbstractWebSocket):
-    '''WebSocket Server'''
+    '''WebSocket Server
+
+    Every connected client has its own queue of items to send, so a slow
+    client does not hold back the others.
+    '''
+
+    def __init__(self, *, slow_consumer: str = 'drop', **kwargs) -> None:
+        '''Return once the server is listening, or raise the exception
+        preventing it from listening.
+        '''
+        assert slow_consumer in SLOW_CONSUMER_POLICIES, \
+            f'slow_consumer must be one of {SLOW_CONSUMER_POLICIES}.'
+        self._slow_consumer = slow_consumer
+        super().__init__(**kwargs)
+        self._ready.wait()
+        if self._error is not None:
+            self._thread.join()
+            if self._own_executor:
+                self._executor.shutdown()
+            raise self._error
+
+    def send(self, item: Union[str, bytes, Jsonable], key: Optional[Hashable] = None) -> None:
+        '''Instruct WebSocket to send a item to all clients.'''
+        self.broadcast(item, key)
+
+    def broadcast(self, item: Union[str, bytes, Jsonable], key: Optional[Hashable] = None) -> None:
+        '''Instruct WebSocket to send a item to all clients.
+
+        Only clients connected at this time receive the item, so it is
+        discarded if there are none. With overflow='raise' or 'block',
+        queue.Full is raised after the item is queued for the other clients.
+        '''
+        # Serialize once for all clients.
+        item = self._serialize(item)
+        full = None
+        for client_id, channel in list(self._clients.items()):
+            try:
+                self._put(client_id, channel, item, key)
+            except Full as exc:
+                full = exc
+        if full is not None:
+            raise full
+
+    def send_to(self, client_id: int, item: Union[str, bytes, Jsonable],
+                key: Optional[Hashable] = None) -> None:
+        '''Instruct WebSocket to send a item to one client.
+
+        Raise KeyError if the client is not connected.
+        '''
+        self._put(client_id, self._clients[client_id], item, key)
+
+    def clients(self) -> List[int]:
+        '''Ids of connected clients.'''
+        return list(self._clients)
+
+    def stats(self) -> dict:
+        '''Queue depth and counters of sent, dropped and coalesced items of every client.'''
+        return {client_id: channel.stats() for client_id, channel in list(self._clients.items())}
+
+    def join(self) -> None:
+        '''Block until all items are actually sent or their clients disconnect.'''
+        for channel in list(self._clients.values()):
+            channel.join()
+
+    def _setup(self):
+        self._clients = {}
+        self._next_id = 0
+        self._closing = None
+
+    def _stop(self):
+        if self._event_loop is not None:
+            try:
+                self._event_loop.call_soon_threadsafe(self._closing.set)
+            except RuntimeError:
+                # The event loop has already been closed.
+                pass
+
+    def _put(self, client_id, channel, item, key=None):
+        item = self._serialize(item)
+        if not channel.put(item, key, drop=self._slow_consumer == 'drop'):
+            self._logger.warning(f'disconnect slow client {client_id}')
+            channel.close()
 
     async def _async_main(self):
+        self._closing = asyncio.Event()
+        self._event_loop = asyncio.get_running_loop()
         app = web.Application()
         app.add_routes([web.get(self._route, self._handler)])
         runner = web.AppRunner(app)
         await runner.setup()
-        site = web.TCPSite(runner, self._host, self._port)
-        await site.start()
-        while not self._stopped:
-            await asyncio.sleep(0.1)
-        await runner.cleanup()
+        try:
+            site = web.TCPSite(runner, self._host, self._port)
+            await site.start()
+            self._logger.info('start')
+            self._logger.info(f'callbacks: {self._callbacks}')
+            self._ready.set()
+            if self._running:
+                await self._closing.wait()
+            for channel in list(self._clients.values()):
+                channel.close()
+        finally:
+            await runner.cleanup()
+        self._logger.info('close')
 
     async def _handler(self, request):
-        ws = web.WebSocketResponse()
+        ws = web.WebSocketResponse(compress=self._compress, heartbeat=self._heartbeat,
+                                   protocols=self._protocols())
         await ws.prepare(request)
-        await self._loop(ws)
+        if not self._running:
+            await ws.close()
+            return ws
+        client_id = self._next_id
+        self._next_id += 1
+        channel = self._make_channel(client_id)
+        self._clients[client_id] = channel
+        self._logger.info(f'connect {client_id}')
+        self._hook(self._on_connect, client_id)
+        try:
+            await self._loop(ws, channel, self._bind_callbacks(client_id),
+                             partial(self._put, client_id, channel),
+                             batch=ws.ws_protocol == BATCH_PROTOCOL)
+        finally:
+            del self._clients[client_id]
+            channel.discard()
+            self._logger.info(f'disconnect {client_id}')
+            self._hook(self._on_disconnect, client_id)
         return ws
 
+    def _bind_callbacks(self, client_id):
+        '''Pass client_id to callbacks taking it.'''
+        return {
+            key: [self._bind(cb, client_id) for cb in cbs]
+            for key, cbs in self._callbacks.items()
+        }
+
 
 class WebSocketClient(_AbstractWebSocket):
-    '''WebSocket Client'''
+    '''WebSocket Client
+
+    If reconnect is set, the client connects again after failing to connect
+    or losing the connection, waiting as RetryPolicy.backoff() says, and
+    items sent in the meantime are queued.
+    '''
+
+    def __init__(self, *,
+                 reconnect: Union[bool, RetryPolicy] = False,
+                 max_reconnects: Optional[int] = None,
+                 replay: int = 0,
+                 **kwargs) -> None:
+        if reconnect is True:
+            reconnect = RetryPolicy()
+        self._reconnect = reconnect or None
+        self._max_reconnects = max_reconnects
+        self._replay = replay
+        super().__init__(**kwargs)
+
+    def send(self, item: Union[str, bytes, Jsonable], key: Optional[Hashable] = None) -> None:
+        '''Instruct WebSocket to send a item.
+
+        Jsonable items are serialized here, so errors of dumps are raised
+        to the caller. Raise queue.Full if the queue is full and overflow
+        is 'raise', or 'block' and send_timeout expires.
+        '''
+        self._channel.put(self._serialize(item), key)
+
+    def stats(self) -> dict:
+        '''Queue depth and counters of sent, dropped, coalesced and replayed items.'''
+        return self._channel.stats()
+
+    def join(self) -> None:
+        '''Block until all items are actually sent.'''
+        self._channel.join()
+
+    def _setup(self):
+        self._channel = self._make_channel(replay=self._replay)
+        self._closing = None
+        self._pong = None
+        self._pings = set()     # Payloads of pings not answered yet.
+        self._received = False
+
+    def _stop(self):
+        self._channel.close()
+        if self._event_loop is not None:
+            try:
+                self._event_loop.call_soon_threadsafe(self._closing.set)
+            except RuntimeError:
+                # The event loop has already been closed.
+                pass
+
+    def _on_pong(self, data):
+        # Pings carry written() of the channel, so a pong acknowledges
+        # the items written before its ping. Unsolicited pongs are allowed
+        # by RFC 6455 and ignored.
+        if data not in self._pings:
+            self._logger.debug(f'ignore unsolicited pong {reprlib.repr(data)}')
+            return
+        # Earlier pings are answered by this pong as well.
+        self._pings.clear()
+        self._channel.ack(int(data))
+        self._pong.set()
+        self._received = True
+
+    def _on_receive(self):
+        self._received = True
 
     async def _async_main(self):
-        async with ClientSession() as session:
-            async with session.ws_connect(f'http://{self._host}:{self._port}'
-                                          f'{self._route}') as ws:
-                await self._loop(ws)
+        self._closing = asyncio.Event()
+        self._event_loop = asyncio.get_running_loop()
+        url = f'http://{self._host}:{self._port}{self._route}'
+        options = {
+            # 15 is the largest window for permessage-deflate, and 0 disables it.
+            'compress': 15 if self._compress else 0,
+            # Pongs are handled by _reader.
+            'autoping': False,
+            'protocols': self._protocols(),
+        }
+        if self._heartbeat is not None:
+            # Do not wait long for a dead server to close the connection.
+            options['timeout'] = ClientWSTimeout(ws_close=self._heartbeat)
+        self._logger.info('start')
+        self._logger.info(f'callbacks: {self._callbacks}')
+        failures = 0
+        try:
+            async with ClientSession() as session:
+                while self._running:
+                    try:
+                        ws = await session.ws_connect(url, **options)
+                    except (ClientError, asyncio.TimeoutError, OSError) as exc:
+                        failures += 1
+                        if self._reconnect is None or (self._max_reconnects is not None
+                                                       and failures > self._max_reconnects):
+                            self._logger.error(f'fail to connect: {exc!r}')
+                            break
+                        delay = self._reconnect.backoff(failures - 1)
+                        self._logger.warning(f'fail to connect: {exc!r}, '
+                                             f'retry in {delay:.2f} seconds')
+                        await self._backoff(delay)
+                        continue
+                    self._received = False
+                    connected = self._event_loop.time()
+                    async with ws:
+                        await self._connected(ws)
+                    if self._reconnect is None or not self._running:
+                        break
+                    # A connection lost before anything arrives counts as a
+                    # failure, unless it has stayed up for backoff_max, so a
+                    # server accepting and closing at once is not hammered.
+                    if (self._received or self._event_loop.time() - connected
+                            >= self._reconnect.backoff_max):
+                        failures = 0
+                    else:
+                        failures += 1
+                        if self._max_reconnects is not None and failures > self._max_reconnects:
+                            self._logger.error('connection lost too many times')
+                            break
+                    delay = self._reconnect.backoff(max(failures - 1, 0))
+                    self._logger.warning(f'connection lost, retry in {delay:.2f} seconds')
+                    await self._backoff(delay)
+        finally:
+            self._channel.discard()
+        self._logger.info('close')
+
+    async def _backoff(self, delay):
+        '''Wait delay seconds unless the client is closed.'''
+        try:
+            await asyncio.wait_for(self._closing.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _connected(self, ws):
+        self._logger.info('connect')
+        self._channel.replay()
+        self._pong = asyncio.Event()
+        self._pings.clear()
+        self._hook(self._on_connect)
+        self._ready.set()
+        others = [self._heartbeat_loop(ws)] if self._heartbeat is not None else []
+        try:
+            await self._loop(ws, self._channel, self._callbacks, self.send, *others,
+                             batch=ws.protocol == BATCH_PROTOCOL)
+        finally:
+            self._ready.clear()
+            self._logger.info('disconnect')
+            self._hook(self._on_disconnect)
+
+    async def _heartbeat_loop(self, ws):
+        '''Ping the server every heartbeat seconds, and return if it does not answer.'''
+        while True:
+            await asyncio.sleep(self._heartbeat)
+            self._pong.clear()
+            payload = str(self._channel.written()).encode()
+            self._pings.add(payload)
+            await ws.ping(payload)
+            try:
+                await asyncio.wait_for(self._pong.wait(), self._heartbeat)
+            except asyncio.TimeoutError:
+                self._logger.warning(f'no pong in {self._heartbeat} seconds')
+                return
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import json
+import unittest
+
+from ..benchmarks import bench_client, bench_websocket
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def check(self, report, operations):
+        json.dumps(report)
+        self.assertEqual(report['operations'], operations)
+        self.assertGreater(report['throughput'], 0)
+        self.assertLessEqual(report['latency']['p50'], report['latency']['p99'])
+        self.assertGreater(report['cpu_seconds'], 0)
+
+    def test_client(self):
+        report = bench_client.run(50, 8, 2, 4, 100)
+        self.check(report, 50)
+        self.assertEqual(report['failed'], 0)
+        self.assertLessEqual(report['connections'], 8)
+
+    def test_websocket(self):
+        for kind in ['bytes', 'str', 'json']:
+            self.check(bench_websocket.run(20, 5, kind, 100), 20)
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import tempfile
+import unittest
+
+from aiohttp import web
+
+from ..benchmarks._server import LocalServer
+from ..src import Cache, Client
+
+
+class TestCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.hits = {}
+
+        async def handler(request):
+            path = request.path
+            cls.hits[path] = cls.hits.get(path, 0) + 1
+            headers = {}
+            if path == '/fresh':
+                headers['Cache-Control'] = 'max-age=60'
+            elif path == '/etag':
+                headers['Cache-Control'] = 'no-cache'
+                headers['ETag'] = '"v1"'
+                if request.headers.get('If-None-Match') == '"v1"':
+                    return web.Response(status=304, headers=headers)
+            elif path == '/vary':
+                headers['Cache-Control'] = 'max-age=60'
+                headers['Vary'] = 'Accept'
+            elif path == '/no-store':
+                headers['Cache-Control'] = 'no-store, max-age=60'
+            return web.Response(body=path.encode() * 100, headers=headers)
+
+        app = web.Application()
+        app.add_routes([web.route('*', '/{tail:.*}', handler)])
+        cls.server = LocalServer(app).__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__(None, None, None)
+
+    def setUp(self):
+        self.hits.clear()
+
+    def get(self, client, path, **kwargs):
+        return client.request(f'{self.server.url}{path}', **kwargs).result()
+
+    def test_cache(self):
+        cache = Cache()
+        with Client({'cache': cache}) as client:
+            for path in ['/fresh', '/etag', '/vary', '/no-store']:
+                first = self.get(client, path)
+                second = self.get(client, path)
+                self.assertEqual(first.body, second.body)
+                self.assertEqual(second.status, 200)
+                self.assertEqual(second.request.url.path, path)
+            self.get(client, '/vary', headers={'Accept': 'text/html'})
+            self.get(client, '/fresh', headers={'Cache-Control': 'no-cache'})
+            self.get(client, '/fresh', method='POST')
+            # Requests with their own credentials bypass the cache.
+            self.get(client, '/fresh', headers={'authorization': 'Bearer a'})
+            self.get(client, '/fresh', headers={'Cookie': 'a=1'})
+            self.get(client, '/fresh', cookies={'a': '1'})
+        self.assertEqual(self.hits, {'/fresh': 6, '/etag': 2, '/vary': 2, '/no-store': 2})
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['revalidations'], 1)
+        self.assertEqual(cache.stats()['misses'], 7)
+
+    def test_size(self):
+        cache = Cache(max_bytes=1000)
+        with Client({'cache': cache}) as client:
+            self.get(client, '/fresh')
+            self.assertEqual(cache.stats()['entries'], 1)
+            self.get(client, '/vary')
+            self.assertEqual(cache.stats()['entries'], 1)
+            self.get(client, '/fresh')
+        self.assertEqual(self.hits['/fresh'], 2)
+        self.assertLessEqual(cache.stats()['bytes'], 1000)
+
+    def test_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with Client({'cache': Cache(directory=directory)}) as client:
+                self.get(client, '/fresh')
+            cache = Cache(directory=directory)
+            with Client({'cache': cache}) as client:
+                resp = self.get(client, '/fresh')
+        self.assertEqual(resp.body, b'/fresh' * 100)
+        self.assertEqual(resp.headers['Cache-Control'], 'max-age=60')
+        self.assertEqual(self.hits['/fresh'], 1)
+        self.assertEqual(cache.stats()['hits'], 1)
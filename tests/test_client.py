@@ -1,11 +1,32 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
+import socket
 import unittest
-from concurrent.futures import wait
+from concurrent.futures import CancelledError, wait
+from pathlib import Path
+from time import perf_counter
 
-from ..src import Client
+from aiohttp import web
+
+from ..benchmarks._server import LocalServer
+from ..src import AsyncClient, Client, Resolver, RetryPolicy, Runtime
+
+
+def body_length(resp):
+    return len(resp.body)
+
+
+class SlowResolver(Resolver):
+    '''Resolve every host to 127.0.0.1 in 0.1s.'''
+
+    async def lookup(self, host, family):
+        await asyncio.sleep(0.1)
+        addr = {'hostname': host, 'host': '127.0.0.1', 'port': 0,
+                'family': socket.AF_INET, 'proto': 0, 'flags': 0}
+        return [addr], None
 
 
 class TestClient(unittest.TestCase):
@@ -35,6 +56,297 @@ class TestClient(unittest.TestCase):
             ])
             print('@@@@ test concurrency')
 
+    def test_dispatch(self):
+        setting = {
+            'concurrency': 16,
+            'concurrency_per_host': 16,
+        }
+        with LocalServer() as server, Client(setting) as client:
+            start = perf_counter()
+            futs = [client.request(f'{server.url}/{i}') for i in range(200)]
+            wait(futs)
+            elapsed = perf_counter() - start
+        self.assertTrue(all(fut.result().status == 200 for fut in futs))
+        # The dispatcher used to poll, capping throughput at ~10 requests/sec.
+        self.assertLess(elapsed, 5)
+
+    def test_request_many(self):
+        with LocalServer() as server, Client() as client:
+            urls = [f'{server.url}/{i}' for i in range(50)]
+            items = iter(urls + [{'url': server.url, 'method': 'POST', 'body': b'a'}])
+            resps = list(client.request_many(items, lookahead=8))
+        self.assertEqual(len(resps), 51)
+        self.assertTrue(all(resp.status == 200 for resp in resps))
+        self.assertEqual({str(resp.url) for resp in resps}, set(urls) | {server.url})
+        post_resp = next(resp for resp in resps if resp.request.method == 'POST')
+        self.assertEqual(post_resp.body, b'a')
+
+    def test_async_client(self):
+        async def main(url):
+            async with AsyncClient({'headers': {'hk': 'hv'}}) as client:
+                return await asyncio.gather(
+                    client.request(f'{url}/get'),
+                    client.request(f'{url}/post', method='POST', json={'a': 'b'}),
+                )
+
+        with LocalServer() as server:
+            get_resp, post_resp = asyncio.run(main(server.url))
+        self.assertEqual(get_resp.status, 200)
+        self.assertEqual(post_resp.json(), {'a': 'b'})
+
+    def test_save_to(self):
+        file = './test_save_to'
+        body = os.urandom(256*1024)
+        with LocalServer() as server, Client() as client:
+            resp = client.request(server.url, method='POST', body=body, save_to=file).result()
+            large_resp = client.request(server.url, method='POST', body=body,
+                                        save_to=f'{file}_large', max_body_size=1024).result()
+            small_resp = client.request(server.url, method='POST', body=b'a',
+                                        max_body_size=1024).result()
+            # 0 is a limit rather than no limit.
+            empty_resp = client.request(server.url, method='POST', body=b'a',
+                                        max_body_size=0).result()
+            # The error opening the file is not masked by the cleanup.
+            missing_resp = client.request(server.url, method='POST', body=b'a',
+                                          save_to='./missing/test_save_to').result()
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.body, b'')
+        self.assertEqual(resp.path, Path(file))
+        self.assertEqual(large_resp.status, -1)
+        self.assertIn('BodyTooLargeError', large_resp.reason)
+        self.assertFalse(os.path.exists(f'{file}_large'))
+        self.assertEqual(small_resp.body, b'a')
+        self.assertIn('BodyTooLargeError', empty_resp.reason)
+        self.assertIn('FileNotFoundError', missing_resp.reason)
+        with open(file, 'rb') as f:
+            self.assertEqual(f.read(), body)
+        os.remove(file)
+
+    def test_retry_after(self):
+        async def handler(request):
+            if request.path == '/429':
+                return web.Response(status=429, headers={'Retry-After': '0.5'})
+            return web.Response()
+
+        app = web.Application()
+        app.add_routes([web.get('/{tail:.*}', handler)])
+        with LocalServer(app) as server, Client() as client:
+            self.assertEqual(client.request(f'{server.url}/429').result().status, 429)
+            start = perf_counter()
+            self.assertEqual(client.request(f'{server.url}/200').result().status, 200)
+            self.assertGreater(perf_counter() - start, 0.4)
+
+    def test_retry_policy(self):
+        attempts = {}
+
+        async def handler(request):
+            # /n fails n times before it succeeds.
+            attempts[request.path] = attempts.get(request.path, 0) + 1
+            if attempts[request.path] <= int(request.path[1:]):
+                return web.Response(status=503)
+            return web.Response()
+
+        app = web.Application()
+        app.add_routes([web.get('/{tail:.*}', handler)])
+        setting = {
+            'retry': 2,
+            'retry_policy': RetryPolicy(backoff_base=0.5, jitter=False),
+            'concurrency': 1,
+        }
+        no_budget = RetryPolicy(budget=0, budget_reserve=0)
+        with LocalServer(app) as server, Client(setting) as client:
+            flaky = client.request(f'{server.url}/2')
+            fast = client.request(f'{server.url}/0')
+            self.assertEqual(fast.result(timeout=0.4).status, 200)
+            self.assertFalse(flaky.done())
+            self.assertEqual(flaky.result().status, 200)
+            self.assertEqual(client.request(f'{server.url}/3').result().status, 503)
+            self.assertEqual(client.request(f'{server.url}/1', retry_policy=no_budget).result().status, 503)
+            self.assertEqual(client.request(f'{server.url}/4', retry=0).result().status, 503)
+        self.assertEqual(attempts, {'/0': 1, '/1': 1, '/2': 3, '/3': 3, '/4': 1})
+
+    def test_headers(self):
+        async def handler(request):
+            return web.json_response({
+                'headers': dict(request.headers),
+                'cookies': dict(request.cookies),
+            })
+
+        app = web.Application()
+        app.add_routes([web.get('/', handler)])
+        setting = {
+            'headers': {'hk': 'hv', 'Accept': 'text/html'},
+            'cookies': {'ck': 'cv'},
+        }
+        with LocalServer(app) as server, Client(setting) as client:
+            default = client.request(server.url).result().json()
+            override = client.request(server.url, headers={'hk': 'v', 'a': 'b'},
+                                      cookies={'a': 'b'}).result().json()
+        self.assertEqual(default['headers']['hk'], 'hv')
+        self.assertEqual(default['headers']['Accept'], 'text/html')
+        self.assertEqual(default['cookies'], {'ck': 'cv'})
+        self.assertEqual(override['headers']['hk'], 'v')
+        self.assertEqual(override['headers']['a'], 'b')
+        self.assertEqual(override['headers']['Accept'], 'text/html')
+        self.assertEqual(override['cookies'], {'ck': 'cv', 'a': 'b'})
+
+    def test_parse(self):
+        html = '<title>t</title><a href="/x">x</a>'
+        setting = {'parse_workers': 2}
+        with LocalServer() as server, Client(setting) as client:
+            def post(body, parse):
+                return client.request(server.url, method='POST', text=body, parse=parse)
+
+            futs = [
+                post('{"a": 1}', 'json'),
+                post('text', 'text'),
+                post(html, ('etree-xpath', '//title/text()', '//a')),
+                post('abc', body_length),
+                post('abc', 'unknown'),
+            ]
+            json_resp, text_resp, xpath_resp, func_resp, bad_resp = [fut.result() for fut in futs]
+        self.assertEqual(json_resp.parsed, {'a': 1})
+        self.assertEqual(text_resp.parsed, 'text')
+        self.assertEqual(xpath_resp.parsed, [['t'], ['<a href="/x">x</a>']])
+        self.assertEqual(func_resp.parsed, 3)
+        self.assertIsInstance(bad_resp.parsed, ValueError)
+        self.assertEqual(bad_resp.status, 200)
+
+    def test_coalesce(self):
+        hits = []
+
+        async def handler(request):
+            hits.append(request.path_qs)
+            await asyncio.sleep(0.2)
+            return web.Response(text=request.path_qs)
+
+        app = web.Application()
+        app.add_routes([web.route('*', '/{tail:.*}', handler)])
+        with LocalServer(app) as server:
+            with Client({'coalesce': True, 'concurrency': 1}) as client:
+                futs = [client.request(server.url, meta={'i': i}) for i in range(5)]
+                other = client.request(server.url, params={'a': '1'})
+                post = client.request(server.url, method='POST')
+                resps = [fut.result() for fut in futs]
+                self.assertEqual(other.result().text(), '/?a=1')
+                self.assertEqual(post.result().status, 200)
+            self.assertEqual(sorted(hits), ['/', '/', '/?a=1'])
+            self.assertEqual([resp.meta for resp in resps], [{'i': i} for i in range(5)])
+            self.assertEqual(len({id(resp.request) for resp in resps}), 5)
+            self.assertTrue(all(resp.text() == '/' for resp in resps))
+            hits.clear()
+            with Client({'concurrency': 5}) as client:
+                wait([client.request(server.url) for _ in range(5)])
+            self.assertEqual(len(hits), 5)
+
+    def test_pool(self):
+        setting = {
+            'concurrency': 4,
+            'concurrency_per_host': 2,
+        }
+        with LocalServer() as server, Client(setting) as client:
+            self.assertEqual(client.pool_stats()['open'], 0)
+            for _ in range(5):
+                wait([client.request(server.url) for _ in range(4)])
+            stats = client.pool_stats()
+        self.assertEqual(stats['created'], 2)
+        self.assertEqual(stats['reused'], 18)
+        self.assertEqual(stats['open'], 2)
+        self.assertEqual(stats['idle'], 2)
+        self.assertEqual(stats['created_per_second'], 0.2)
+        setting['keepalive_timeout'] = 0
+        with LocalServer() as server, Client(setting) as client:
+            wait([client.request(server.url) for _ in range(4)])
+            self.assertEqual(client.pool_stats()['created'], 4)
+
+    def test_timing(self):
+        async def handler(request):
+            if request.path == '/503':
+                return web.Response(status=503)
+            await asyncio.sleep(0.1)
+            resp = web.StreamResponse()
+            await resp.prepare(request)
+            await resp.write(b'a')
+            await asyncio.sleep(0.1)
+            await resp.write(b'b')
+            await resp.write_eof()
+            return resp
+
+        app = web.Application()
+        app.add_routes([web.get('/{tail:.*}', handler)])
+        setting = {
+            'concurrency': 1,
+            'retry_policy': RetryPolicy(backoff_base=0.1, jitter=False),
+            'resolver': SlowResolver(),
+        }
+        with LocalServer(app) as server, Client(setting) as client:
+            url = server.url.replace('127.0.0.1', 'example.test')
+            first = client.request(f'{url}/')
+            second = client.request(f'{url}/')
+            first, second = first.result(), second.result()
+            retried = client.request(f'{url}/503').result()
+            stats = client.stats()
+        self.assertEqual(first.body, b'ab')
+        self.assertEqual(first.timing.attempts, 1)
+        self.assertGreaterEqual(first.timing.dns, 0.09)
+        self.assertGreater(first.timing.connect, 0)
+        self.assertGreaterEqual(first.timing.ttfb, 0.09)
+        self.assertGreaterEqual(first.timing.transfer, 0.09)
+        self.assertGreaterEqual(first.timing.total, 0.3)
+        self.assertGreaterEqual(second.timing.queue, 0.15)
+        self.assertEqual(second.timing.connect, 0)
+        self.assertEqual(retried.timing.attempts, 2)
+        self.assertEqual(retried.timing.backoff, 0.1)
+        host = stats['hosts']['example.test']
+        self.assertEqual(host['requests'], 3)
+        self.assertEqual(host['attempts'], 4)
+        self.assertEqual(host['statuses'], {200: 2, 503: 1})
+        latency = host['latency']
+        self.assertEqual(latency['count'], 3)
+        self.assertEqual(sum(latency['buckets'].values()), 3)
+        self.assertLessEqual(latency['p50'], latency['p90'])
+        self.assertLessEqual(latency['p90'], latency['p99'])
+        self.assertEqual(stats['pool']['created'], 1)
+
+    def test_close(self):
+        async def slow(request):
+            await asyncio.sleep(0.3)
+            return web.Response(text='done')
+
+        app = web.Application()
+        app.add_routes([web.get('/slow', slow)])
+        with LocalServer(app) as server:
+            start = perf_counter()
+            Client().close()
+            # Closing used to sleep for more than a second.
+            self.assertLess(perf_counter() - start, 0.5)
+
+            client = Client()
+            futs = [client.request(f'{server.url}/slow') for _ in range(4)]
+            client.close()
+            self.assertEqual([fut.result().text() for fut in futs], ['done'] * 4)
+            # Closing again does nothing.
+            client.close()
+
+            for drain, timeout in [(False, None), (True, 0.05)]:
+                client = Client()
+                futs = [client.request(f'{server.url}/slow') for _ in range(4)]
+                start = perf_counter()
+                client.close(drain=drain, timeout=timeout)
+                self.assertLess(perf_counter() - start, 0.25)
+                for fut in futs:
+                    with self.assertRaises(CancelledError):
+                        fut.result()
+
+    def test_start_error(self):
+        # The constructor raises what prevents the client from starting.
+        with self.assertRaises(TypeError):
+            Client({'hosts': {'a': {'concurrency': 'x'}}})
+        with Runtime() as runtime:
+            with self.assertRaises(TypeError):
+                Client({'hosts': {'a': {'concurrency': 'x'}}, 'runtime': runtime})
+            self.assertEqual(runtime.stats()['hosted'], [0])
+
     def test_exception(self):
         with Client() as client:
             resp = client.request('').result()
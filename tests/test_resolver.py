@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+import unittest
+
+from ..benchmarks._server import LocalServer
+from ..src import Client, Resolver
+
+
+def addr(host, ip, family=socket.AF_INET):
+    return {'hostname': host, 'host': ip, 'port': 0, 'family': family, 'proto': 0, 'flags': 0}
+
+
+class FakeResolver(Resolver):
+
+    def __init__(self, *args, records=None, record_ttl=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.records = records or {}
+        self.record_ttl = record_ttl
+        self.lookups = []
+
+    async def lookup(self, host, family):
+        self.lookups.append(host)
+        await asyncio.sleep(0.01)
+        return self.records[host], self.record_ttl
+
+
+class TestResolver(unittest.TestCase):
+
+    def test_static(self):
+        resolver = FakeResolver(static={'example.test': '127.0.0.1'})
+        with LocalServer() as server, Client({'resolver': resolver}) as client:
+            url = server.url.replace('127.0.0.1', 'example.test')
+            resp = client.request(f'{url}/a', method='POST', body=b'a').result()
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.body, b'a')
+        self.assertEqual(resolver.lookups, [])
+
+    def test_ttl(self):
+        resolver = FakeResolver(records={'a.test': [addr('a.test', '10.0.0.1')]}, record_ttl=0.1)
+
+        async def main():
+            results = await asyncio.gather(*[resolver.resolve('a.test', 80) for _ in range(5)])
+            self.assertTrue(all(result[0]['port'] == 80 for result in results))
+            self.assertEqual(len(resolver.lookups), 1)
+            await resolver.resolve('a.test', 443)
+            self.assertEqual(len(resolver.lookups), 1)
+            await asyncio.sleep(0.15)
+            await resolver.resolve('a.test', 80)
+            self.assertEqual(len(resolver.lookups), 2)
+
+        asyncio.run(main())
+        self.assertEqual(resolver.stats(), {'hits': 1, 'misses': 2, 'entries': 1})
+
+    def test_sweep(self):
+        records = {f'{i}.test': [addr(f'{i}.test', f'10.0.0.{i}')] for i in range(10)}
+        resolver = FakeResolver(ttl=0.1, records=records)
+
+        async def main():
+            for i in range(9):
+                await resolver.resolve(f'{i}.test')
+            self.assertEqual(resolver.stats()['entries'], 9)
+            await asyncio.sleep(0.15)
+            # Expired entries are dropped once another one is added.
+            await resolver.resolve('9.test')
+            self.assertEqual(resolver.stats()['entries'], 1)
+
+        asyncio.run(main())
+
+    def test_interleave(self):
+        records = {'a.test': [
+            addr('a.test', '::1', socket.AF_INET6),
+            addr('a.test', '::2', socket.AF_INET6),
+            addr('a.test', '::3', socket.AF_INET6),
+            addr('a.test', '10.0.0.1'),
+        ]}
+        resolver = FakeResolver(records=records, static={'b.test': ['10.0.0.2', '::4']})
+        result = asyncio.run(resolver.resolve('a.test', 80, socket.AF_UNSPEC))
+        self.assertEqual([item['host'] for item in result], ['::1', '10.0.0.1', '::2', '::3'])
+        result = asyncio.run(resolver.resolve('b.test', 80, socket.AF_UNSPEC))
+        self.assertEqual([item['host'] for item in result], ['10.0.0.2', '::4'])
+        result = asyncio.run(resolver.resolve('b.test', 80, socket.AF_INET6))
+        self.assertEqual([item['host'] for item in result], ['::4'])
+
+    def test_prefetch(self):
+        records = {'a.test': [addr('a.test', '10.0.0.1')]}
+        resolver = FakeResolver(records=records, prefetch=['a.test', 'missing.test'])
+        with Client({'resolver': resolver}):
+            self.assertEqual(sorted(resolver.lookups), ['a.test', 'missing.test'])
+        with Client({'resolver': resolver}):
+            self.assertEqual(sorted(resolver.lookups), ['a.test', 'missing.test', 'missing.test'])
+        self.assertEqual(resolver.stats()['hits'], 1)
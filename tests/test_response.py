@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import codecs
 import unittest
 
 from yarl import URL
@@ -45,3 +46,80 @@ class TestResponse(unittest.TestCase):
         self.assertEqual(p, 'p')
         self.assertEqual(str(json_response), f'<Response {status} {url}>')
         self.assertEqual(hash(json_response), id(json_response))
+
+    def test_cache(self):
+        url = URL('http://www.baidu.com/')
+        request = Request(url)
+
+        def make_response(body, headers):
+            return Response(
+                url=url,
+                status=200,
+                reason='OK',
+                headers=headers,
+                body=body,
+                request=request,
+                meta=request.meta,
+            )
+
+        text = '中文' * 100
+        gbk_response = make_response(text.encode('gbk'), {'Content-Type': 'text/html; charset=GBK'})
+        self.assertEqual(gbk_response._encoding(), 'gbk')
+        self.assertEqual(gbk_response.text(), text)
+        self.assertIs(gbk_response.text(), gbk_response.text())
+        self.assertEqual(gbk_response.text('latin-1'), text.encode('gbk').decode('latin-1'))
+
+        bom_response = make_response(codecs.BOM_UTF8 + b'{"a": 1}', {})
+        self.assertEqual(bom_response.text(), '{"a": 1}')
+        json_response = make_response(b'{"a": 1}', {})
+        self.assertIs(json_response.json(), json_response.json())
+        self.assertIs(json_response.etree(), json_response.etree())
+
+        large_text = '<p>ascii</p>' * 10000
+        large_response = make_response(large_text.encode(), {})
+        self.assertEqual(large_response.text(), large_text)
+        # Non-ASCII characters after an ASCII prefix.
+        mixed_text = '<p>ascii</p>' * 8000 + '中文 café'
+        mixed_response = make_response(mixed_text.encode(), {})
+        self.assertEqual(mixed_response.text(), mixed_text)
+        latin_text = '<p>ascii</p>' * 8000 + 'café ' * 100
+        latin_response = make_response(latin_text.encode('latin-1'), {})
+        self.assertEqual(latin_response.text(), latin_text)
+        # A charset in Content-Type which does not match the body.
+        for mismatched_text in ['café' * 10, '<p>ascii</p>' * 6000 + 'café' * 10]:
+            mismatched_response = make_response(mismatched_text.encode('latin-1'),
+                                                {'Content-Type': 'text/html; charset=utf-8'})
+            self.assertEqual(mismatched_response.text(), mismatched_text)
+            self.assertNotEqual(mismatched_response._encoding(), 'utf-8')
+
+    def test_html_parser(self):
+        url = URL('http://www.baidu.com/')
+        request = Request(url)
+        response = Response(
+            url=url,
+            status=200,
+            reason='OK',
+            headers={},
+            body=b'<title>t</title><p>p<br>q</p>',
+            request=request,
+            meta=request.meta,
+            html_parser='lxml',
+        )
+        for parser in [None, 'html5lib', 'lxml', 'html5-parser']:
+            tree = response.etree(parser=parser)
+            self.assertEqual(tree.xpath('//body/p/text()'), ['p', 'q'])
+            self.assertEqual(tree.xpath('//head/title/text()'), ['t'])
+        self.assertIsNot(response.etree(parser='lxml'), response.etree(parser='html5lib'))
+        with self.assertRaises(ValueError):
+            response.etree(parser='unknown')
+
+        empty_response = Response(
+            url=url,
+            status=200,
+            reason='OK',
+            headers={},
+            body=b'',
+            request=request,
+            meta=request.meta,
+        )
+        self.assertEqual(empty_response.etree(parser='lxml').getroot().tag, 'html')
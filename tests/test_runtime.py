@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import threading
+import unittest
+from concurrent.futures import wait
+
+from ..benchmarks._server import LocalServer
+from ..benchmarks.bench_websocket import free_port
+from ..src import Client, Runtime, WebSocketClient, WebSocketServer
+from .test_websocket import recorder, wait_until
+
+
+class TestRuntime(unittest.TestCase):
+
+    def test_client(self):
+        setting = {'share_connector': True}
+        with LocalServer() as server, Runtime(threads=2) as runtime:
+            threads = threading.active_count()
+            clients = [Client({**setting, 'runtime': runtime}) for _ in range(4)]
+            # Clients run on the Runtime threads instead of their own.
+            self.assertEqual(threading.active_count(), threads)
+            self.assertEqual(runtime.stats(), {'hosted': [2, 2], 'connectors': 2})
+            futs = [client.request(f'{server.url}/{i}')
+                    for i, client in enumerate(clients)]
+            wait(futs)
+            self.assertTrue(all(fut.result().status == 200 for fut in futs))
+            # Clients on one thread share their connections.
+            clients[0].request(f'{server.url}/again').result()
+            clients[2].request(f'{server.url}/again').result()
+            self.assertEqual(clients[0].stats()['pool']['open'], 2)
+            # Every Client adds its own pool size to the shared pool.
+            connector = clients[0]._async_client._session.connector
+            self.assertEqual(connector.limit, 2 * clients[0].setting['concurrency'])
+            clients[2].close()
+            self.assertEqual(connector.limit, clients[0].setting['concurrency'])
+            for client in clients:
+                client.close()
+            self.assertEqual(runtime.stats(), {'hosted': [0, 0], 'connectors': 0})
+            clients[0].close()
+
+    def test_websocket(self):
+        received = []
+        port = free_port()
+        with Runtime() as runtime:
+            setting = {'host': '127.0.0.1', 'port': port, 'runtime': runtime}
+            with WebSocketServer(callbacks=recorder(received), **setting) as server:
+                with WebSocketClient(**setting) as client:
+                    self.assertTrue(client.wait_ready(5))
+                    self.assertEqual(runtime.stats()['hosted'], [2])
+                    client.send('hello')
+                    wait_until(lambda: received == ['hello'])
+                self.assertTrue(server.wait_ready())
+            self.assertEqual(runtime.stats()['hosted'], [0])
+
+    def test_close_first(self):
+        port = free_port()
+        runtime = Runtime()
+        setting = {'host': '127.0.0.1', 'port': port, 'runtime': runtime}
+        server = WebSocketServer(**setting)
+        client = WebSocketClient(**setting)
+        self.assertTrue(client.wait_ready(5))
+        http = Client({'runtime': runtime, 'share_connector': True})
+        # Instances still running are stopped by the Runtime.
+        runtime.close()
+        self.assertEqual(runtime.stats(), {'hosted': [0], 'connectors': 0})
+        for instance in [http, client, server]:
+            closer = threading.Thread(target=instance.close)
+            closer.start()
+            closer.join(5)
+            self.assertFalse(closer.is_alive())
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import unittest
+from math import inf
+
+from ..src.stats import _Histogram
+
+
+class TestStats(unittest.TestCase):
+
+    def test_quantile(self):
+        histogram = _Histogram()
+        self.assertIsNone(histogram.quantile(0.5))
+        for value in [0.003, 0.02, 0.02, 0.3, 100]:
+            histogram.add(value)
+        # Quantiles are the upper bounds of the buckets holding them.
+        self.assertEqual(histogram.quantile(0.2), 0.005)
+        self.assertEqual(histogram.quantile(0.5), 0.025)
+        self.assertEqual(histogram.quantile(0.8), 0.5)
+        self.assertEqual(histogram.quantile(0.99), inf)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 5)
+        self.assertEqual(snapshot['buckets'][0.025], 2)
+        self.assertEqual(snapshot['buckets'][0.05], 0)
+        self.assertEqual(snapshot['p90'], inf)
+        # A value on a bound falls into the bucket of that bound.
+        histogram = _Histogram()
+        histogram.add(0.1)
+        self.assertEqual(histogram.quantile(0.5), 0.1)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+from time import perf_counter
+
+from ..src.throttle import Throttle
+
+
+class TestThrottle(unittest.TestCase):
+
+    def run_requests(self, throttle, hosts):
+        order = []
+        active = {}
+        peak = {}
+
+        async def request(host):
+            async with throttle.request(host):
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+                order.append(host)
+                await asyncio.sleep(0.01)
+                active[host] -= 1
+
+        async def main():
+            await asyncio.gather(*[request(host) for host in hosts])
+
+        asyncio.run(main())
+        return order, peak
+
+    def test_limit(self):
+        throttle = Throttle(4, 2, {'c': {'concurrency': 1}})
+        _, peak = self.run_requests(throttle, ['a'] * 10 + ['b'] * 10 + ['c'] * 10)
+        self.assertEqual(peak, {'a': 2, 'b': 2, 'c': 1})
+
+    def test_fairness(self):
+        throttle = Throttle(1, 1)
+        order, _ = self.run_requests(throttle, ['a'] * 10 + ['b'] * 3)
+        self.assertEqual(order[:7], ['a', 'a', 'b', 'a', 'b', 'a', 'b'])
+
+    def test_weight(self):
+        throttle = Throttle(1, 1, {'a': {'weight': 2}})
+        order, _ = self.run_requests(throttle, ['a'] * 10 + ['b'] * 3)
+        self.assertEqual(order[:7], ['a', 'a', 'a', 'b', 'a', 'a', 'b'])
+
+    def test_rate(self):
+        throttle = Throttle(10, 10, rate=50)
+        start = perf_counter()
+        self.run_requests(throttle, ['a'] * 10 + ['b'] * 10)
+        self.assertGreater(perf_counter() - start, 19 / 50)
+
+    def test_rate_per_host(self):
+        throttle = Throttle(10, 10, {'b': {'rate': None}}, rate_per_host=20)
+        start = perf_counter()
+        self.run_requests(throttle, ['b'] * 10)
+        self.assertLess(perf_counter() - start, 9 / 20)
+        start = perf_counter()
+        self.run_requests(throttle, ['a'] * 10)
+        self.assertGreater(perf_counter() - start, 9 / 20)
+
+    def test_pause(self):
+        throttle = Throttle(10, 10)
+
+        async def main():
+            throttle.pause('a', 0.3)
+            start = perf_counter()
+            async with throttle.request('b'):
+                self.assertLess(perf_counter() - start, 0.3)
+            async with throttle.request('a'):
+                self.assertGreater(perf_counter() - start, 0.3)
+
+        asyncio.run(main())
+
+    def test_pause_waiting(self):
+        throttle = Throttle(1, 1)
+        granted = []
+
+        async def request(i):
+            async with throttle.request('a'):
+                granted.append(perf_counter() - start)
+                if i == 0:
+                    # Let the others start waiting for a slot, as if a 429
+                    # response came back, so they are paused as well.
+                    await asyncio.sleep(0.05)
+                    throttle.pause('a', 0.3)
+                await asyncio.sleep(0.01)
+
+        async def main():
+            await asyncio.gather(*(request(i) for i in range(5)))
+
+        start = perf_counter()
+        asyncio.run(main())
+        self.assertEqual(len(granted), 5)
+        self.assertLess(granted[0], 0.3)
+        self.assertGreater(min(granted[1:]), 0.35)
+
+    def test_eviction(self):
+        throttle = Throttle(2, 1, idle_timeout=0)
+        self.run_requests(throttle, ['a', 'b'])
+        self.assertEqual(throttle._hosts, {})
+
+    def test_cancel(self):
+        throttle = Throttle(1, 1)
+
+        async def hold(event):
+            async with throttle.request('a'):
+                await event.wait()
+
+        async def main():
+            event = asyncio.Event()
+            holder = asyncio.create_task(hold(event))
+            await asyncio.sleep(0)
+            waiter = asyncio.create_task(hold(event))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            event.set()
+            await holder
+            async with throttle.request('a'):
+                return throttle._active
+
+        self.assertEqual(asyncio.run(main()), 1)
@@ -1,10 +1,19 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import socket
 import unittest
-from time import sleep
+from queue import Empty, Full
+from threading import Timer
+from time import perf_counter, sleep
 
-from ..src import Jsonable, WebSocketClient, WebSocketServer
+from aiohttp import web
+
+from ..benchmarks._server import LocalServer
+from ..benchmarks.bench_websocket import free_port
+from ..src import Jsonable, RetryPolicy, WebSocketClient, WebSocketServer
+from ..src.websocket import _Channel, _pack, _unpack
 
 
 HOST = '127.0.0.1'
@@ -17,6 +26,33 @@ DATA = ['str', b'bytes', {'k': 'v'}]
 FLAG = [False, False, False]
 
 
+def wait_until(predicate, timeout=5):
+    deadline = perf_counter() + timeout
+    while not predicate():
+        if perf_counter() > deadline:
+            raise AssertionError('timeout')
+        sleep(0.01)
+
+
+def recorder(received):
+    '''Callbacks appending every received message to received.'''
+    def str_cb(msg: str, client):
+        received.append(msg)
+
+    def bytes_cb(msg: bytes, client):
+        received.append(msg)
+
+    def Jsonable_cb(msg: Jsonable, client):
+        received.append(msg)
+
+    return [str_cb, bytes_cb, Jsonable_cb]
+
+
+def shout(msg: str, server):
+    '''Run in a worker process, so its result is sent back.'''
+    return msg.upper()
+
+
 class TestWebSocket(unittest.TestCase):
 
     @classmethod
@@ -43,12 +79,343 @@ class TestWebSocket(unittest.TestCase):
         FLAG[2] = True
 
     def test_websocket(self):
+        # The client keeps trying until the server starts listening.
         with WebSocketClient(host=HOST, port=PORT, route=ROUTE, maxsize=MAXSIZE,
-                             callbacks=[self.str_cb, self.bytes_cb, self.Jsonable_cb]):
+                             callbacks=[self.str_cb, self.bytes_cb, self.Jsonable_cb],
+                             reconnect=RetryPolicy(backoff_base=0.05)):
             with WebSocketServer(host=HOST, port=PORT, route=ROUTE, maxsize=MAXSIZE) as server:
-                sleep(1)
+                wait_until(server.clients)
                 for data in DATA:
                     server.send(data)
                 server.join()
                 while not all(FLAG):
                     sleep(1)
+
+    def test_server(self):
+        def hello(msg: str, server, client_id):
+            server.send_to(client_id, f'hi {client_id}')
+
+        port = free_port()
+        a_received, b_received = [], []
+        with WebSocketServer(host=HOST, port=port, route=ROUTE, callbacks=[hello]) as server:
+            a = WebSocketClient(host=HOST, port=port, route=ROUTE, callbacks=recorder(a_received))
+            wait_until(lambda: server.clients() == [0])
+            with WebSocketClient(host=HOST, port=port, route=ROUTE,
+                                 callbacks=recorder(b_received)):
+                wait_until(lambda: server.clients() == [0, 1])
+                server.broadcast({'k': 'v'})
+                server.send_to(1, b'only b')
+                a.send('hello')
+                wait_until(lambda: len(a_received) == 2 and len(b_received) == 2)
+            # The server keeps serving other clients after one disconnects.
+            wait_until(lambda: server.clients() == [0])
+            server.send('after')
+            server.join()
+            wait_until(lambda: len(a_received) == 3)
+            with self.assertRaises(KeyError):
+                server.send_to(1, 'gone')
+            a.close()
+        self.assertEqual(sorted(map(str, a_received)), ["after", "hi 0", "{'k': 'v'}"])
+        self.assertEqual(b_received, [{'k': 'v'}, b'only b'])
+
+    def test_slow_consumer(self):
+        for policy in ['drop', 'disconnect']:
+            port = free_port()
+            with WebSocketServer(host=HOST, port=port, route=ROUTE, maxsize=2,
+                                 slow_consumer=policy) as server:
+                # A client whose items are never sent.
+                channel = _Channel(2, server._logger)
+                server._clients[0] = channel
+                for i in range(3):
+                    server.broadcast(str(i))
+                del server._clients[0]
+            items = [item for _, item in channel._items]
+            if policy == 'drop':
+                self.assertEqual(items, ['1', '2'])
+            else:
+                self.assertEqual(items, ['0', '1'])
+                self.assertFalse(channel._running)
+
+    def test_executor(self):
+        received = []
+
+        def slow(msg: bytes, server):
+            sleep(0.2)
+            received.append(msg)
+
+        def fast(msg: str, server):
+            received.append(msg)
+
+        async def later(msg: Jsonable, server):
+            await asyncio.sleep(0.1)
+            received.append(msg)
+
+        port = free_port()
+        with WebSocketServer(host=HOST, port=port, route=ROUTE, executor='thread',
+                             callbacks=[slow, fast, later]):
+            with WebSocketClient(host=HOST, port=port, route=ROUTE) as client:
+                for item in [b'1', b'2', {'k': 'v'}, 'str']:
+                    client.send(item)
+                wait_until(lambda: len(received) == 4)
+        # Slow callbacks do not hold back other types, and items of one
+        # type keep their order.
+        self.assertEqual(received, ['str', {'k': 'v'}, b'1', b'2'])
+
+    def test_process_executor(self):
+        received = []
+        port = free_port()
+        with WebSocketServer(host=HOST, port=port, route=ROUTE, executor='process',
+                             callbacks=[shout]):
+            with WebSocketClient(host=HOST, port=port, route=ROUTE,
+                                 callbacks=recorder(received)) as client:
+                client.send('hello')
+                wait_until(lambda: received == ['HELLO'], timeout=30)
+
+    def test_json(self):
+        calls = []
+
+        def loads(data):
+            calls.append(data)
+            raise ValueError
+
+        received = []
+
+        def text(msg: str, server):
+            received.append(msg)
+
+        port = free_port()
+        with WebSocketServer(host=HOST, port=port, route=ROUTE, callbacks=[text],
+                             loads=loads):
+            with WebSocketClient(host=HOST, port=port, route=ROUTE,
+                                 dumps=lambda obj: f'dumped {obj}') as client:
+                client.send({'k': 'v'})
+                wait_until(lambda: received)
+        # Without Jsonable callbacks, text is never parsed as JSON.
+        self.assertEqual(calls, [])
+        self.assertEqual(received, ["dumped {'k': 'v'}"])
+
+    def test_dumps_error(self):
+        received = []
+        port = free_port()
+        with WebSocketServer(host=HOST, port=port, route=ROUTE,
+                             callbacks=recorder(received)):
+            with WebSocketClient(host=HOST, port=port, route=ROUTE) as client:
+                # Errors of dumps reach the caller, and the connection is kept.
+                with self.assertRaises(TypeError):
+                    client.send({'k': object()})
+                client.send({1: 'a'})
+                wait_until(lambda: received)
+        self.assertEqual(received, [{'1': 'a'}])
+
+    def test_batch(self):
+        records = [(True, 'text'), (False, b'bytes'), (True, '')]
+        self.assertEqual(_unpack(_pack(records)), records)
+        for payload in [b'plain binary payload', b'', _pack(records)[:-1], _pack(records)[:3]]:
+            with self.assertRaises(ValueError):
+                _unpack(payload)
+
+        server_received, client_received = [], []
+        port = free_port()
+        setting = {'host': HOST, 'port': port, 'route': ROUTE,
+                   'compress': True, 'batch_delay': 0.05, 'batch_size': 64}
+        with WebSocketServer(callbacks=recorder(server_received), **setting) as server:
+            with WebSocketClient(callbacks=recorder(client_received), **setting) as client:
+                items = [str(i) for i in range(50)] + [b'bytes', {'k': 'v'}, 'x' * 100]
+                for item in items:
+                    client.send(item)
+                wait_until(lambda: len(server_received) == len(items))
+                server.send('reply')
+                wait_until(lambda: client_received)
+        # Digits are loaded as JSON numbers.
+        self.assertEqual(server_received, list(range(50)) + items[50:])
+        self.assertEqual(client_received, ['reply'])
+
+    def test_batch_mixed(self):
+        # Batching is only used if both ends set batch_delay.
+        for server_delay, client_delay in [(0.01, None), (None, 0.01)]:
+            server_received, client_received = [], []
+            port = free_port()
+            setting = {'host': HOST, 'port': port, 'route': ROUTE}
+            with WebSocketServer(callbacks=recorder(server_received), batch_delay=server_delay,
+                                 **setting) as server:
+                with WebSocketClient(callbacks=recorder(client_received),
+                                     batch_delay=client_delay, **setting) as client:
+                    client.send(b'plain binary payload')
+                    client.send('text')
+                    wait_until(lambda: len(server_received) == 2)
+                    server.send(b'reply')
+                    wait_until(lambda: client_received)
+            self.assertEqual(server_received, [b'plain binary payload', 'text'])
+            self.assertEqual(client_received, [b'reply'])
+
+    def test_overflow(self):
+        def queued(channel):
+            return [item for _, item in channel._items]
+
+        logger = logging.getLogger('WebSocketClient')
+        for policy, expected in [('drop_oldest', ['1', '2']), ('drop_newest', ['0', '1'])]:
+            channel = _Channel(2, logger, overflow=policy)
+            for i in range(3):
+                channel.put(str(i))
+            self.assertEqual(queued(channel), expected)
+            self.assertEqual(channel.stats(), {'depth': 2, 'sent': 0, 'dropped': 1,
+                                               'coalesced': 0, 'replayed': 0})
+
+        channel = _Channel(1, logger, overflow='raise')
+        channel.put('0')
+        with self.assertRaises(Full):
+            channel.put('1')
+
+        channel = _Channel(1, logger, overflow='block', timeout=1)
+        channel.put('0')
+        Timer(0.1, channel._get).start()
+        start = perf_counter()
+        channel.put('1')
+        self.assertGreater(perf_counter() - start, 0.05)
+        self.assertEqual(queued(channel), ['1'])
+        channel._timeout = 0.05
+        with self.assertRaises(Full):
+            channel.put('2')
+
+        channel = _Channel(2, logger, overflow='coalesce')
+        channel.put('a1', key='a')
+        channel.put('b1', key='b')
+        channel.put('a2', key='a')
+        self.assertEqual(queued(channel), ['a2', 'b1'])
+        self.assertEqual(channel._get(), 'a2')
+        # The key is free again once its item is taken.
+        channel.put('a3', key='a')
+        channel.put('c1', key='c')
+        self.assertEqual(queued(channel), ['a3', 'c1'])
+        self.assertEqual(channel.stats()['coalesced'], 1)
+        self.assertEqual(channel.stats()['dropped'], 1)
+
+        marks = []
+        channel = _Channel(0, logger, watermarks=(3, 1), on_watermark=marks.append)
+        for i in range(4):
+            channel.put(i)
+        self.assertEqual(marks, [True])
+        for _ in range(3):
+            channel._get()
+        self.assertEqual(marks, [True, False])
+        channel._get()
+        with self.assertRaises(Empty):
+            channel._get()
+
+    def test_stats(self):
+        marks = []
+
+        def on_watermark(server, high, client_id):
+            marks.append((client_id, high))
+
+        port = free_port()
+        with WebSocketServer(host=HOST, port=port, route=ROUTE, watermarks=(1, 0),
+                             on_watermark=on_watermark) as server:
+            with WebSocketClient(host=HOST, port=port, route=ROUTE) as client:
+                wait_until(lambda: server.clients() == [0])
+                for i in range(3):
+                    client.send(str(i))
+                server.send('hello')
+                client.join()
+                server.join()
+                self.assertEqual(client.stats()['sent'], 3)
+                self.assertEqual(server.stats()[0]['sent'], 1)
+        self.assertEqual(marks, [(0, True), (0, False)])
+
+    def test_reconnect(self):
+        events = []
+        received = []
+        port = free_port()
+        client = WebSocketClient(host=HOST, port=port, route=ROUTE, heartbeat=0.1, replay=10,
+                                 reconnect=RetryPolicy(backoff_base=0.05, backoff_max=0.2),
+                                 on_connect=lambda client: events.append('connect'),
+                                 on_disconnect=lambda client: events.append('disconnect'))
+        with client:
+            for _ in range(2):
+                # The client connects to every server started on the port.
+                with WebSocketServer(host=HOST, port=port, route=ROUTE,
+                                     callbacks=recorder(received)):
+                    client.send('before')
+                    wait_until(lambda: len(received) % 2)
+                    client.send('after')
+                    wait_until(lambda: not len(received) % 2)
+                    # Wait for a pong acknowledging both items.
+                    wait_until(lambda: not client._channel._unacked)
+                wait_until(lambda: len(events) % 2 == 0)
+        self.assertEqual(received, ['before', 'after'] * 2)
+        self.assertEqual(events, ['connect', 'disconnect'] * 2)
+
+    def test_flapping_server(self):
+        connections = []
+
+        async def handler(request):
+            # Accept the connection and close it at once.
+            connections.append(perf_counter())
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            await ws.close()
+            return ws
+
+        app = web.Application()
+        app.add_routes([web.get(ROUTE, handler)])
+        with LocalServer(app) as server:
+            client = WebSocketClient(host=HOST, port=server.port, route=ROUTE, max_reconnects=3,
+                                     reconnect=RetryPolicy(backoff_base=0.05, jitter=False))
+            wait_until(lambda: not client._thread.is_alive())
+            client.close()
+        # Lost connections count toward max_reconnects, with backoff in between.
+        self.assertEqual(len(connections), 4)
+        self.assertGreater(connections[-1] - connections[0], 0.3)
+
+    def test_unsolicited_pong(self):
+        async def handler(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            await ws.pong(b'')
+            await ws.pong(b'not a number')
+            await ws.send_str('hello')
+            # Pings of the client are still answered automatically.
+            async for _ in ws:
+                pass
+            return ws
+
+        app = web.Application()
+        app.add_routes([web.get(ROUTE, handler)])
+        received = []
+        with LocalServer(app) as server:
+            with WebSocketClient(host=HOST, port=server.port, route=ROUTE, heartbeat=0.05,
+                                 replay=10, callbacks=recorder(received)) as client:
+                client.send('item')
+                wait_until(lambda: received)
+                # Answered pings still acknowledge sent items.
+                wait_until(lambda: not client._channel._unacked)
+                self.assertTrue(client.wait_ready(0))
+        self.assertEqual(received, ['hello'])
+
+    def test_replay(self):
+        channel = _Channel(0, logging.getLogger('WebSocketClient'), replay=2)
+        for i in range(4):
+            channel.put(i)
+            channel._done([channel._get()], True)
+        # Only the last 2 items are kept, and item 2 is acknowledged.
+        channel.ack(3)
+        channel.put(4)
+        channel.replay()
+        self.assertEqual([item for _, item in channel._items], [3, 4])
+        self.assertEqual(channel.stats()['replayed'], 1)
+
+    def test_lifecycle(self):
+        port = free_port()
+        start = perf_counter()
+        server = WebSocketServer(host=HOST, port=port, route=ROUTE)
+        # The server is listening once constructed.
+        socket.create_connection((HOST, port)).close()
+        with self.assertRaises(OSError):
+            WebSocketServer(host=HOST, port=port, route=ROUTE)
+        client = WebSocketClient(host=HOST, port=port, route=ROUTE)
+        self.assertTrue(client.wait_ready(5))
+        client.close()
+        self.assertFalse(client.wait_ready())
+        server.close()
+        # Closing used to poll every 0.1s.
+        self.assertLess(perf_counter() - start, 0.5)